@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class DjpieuvreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "djpieuvre"
+
+    def ready(self):
+        from django.core import checks
+
+        from djpieuvre.checks import check_workflow_graphs
+        from djpieuvre.signals import connect_signals
+
+        connect_signals()
+        checks.register(check_workflow_graphs)
@@ -0,0 +1,210 @@
+import itertools
+import typing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+
+from djpieuvre.authorization import AuthorizationSnapshot
+from djpieuvre.conf import get_setting
+from djpieuvre.decorators import acall_hook
+from djpieuvre.exceptions import StaleProcess
+from djpieuvre.executor import acall_hooks
+from djpieuvre.identity import get_identity_map
+from djpieuvre.models import PieuvreProcess, PieuvreTask
+from djpieuvre.utils import aget_content_type, aget_pks
+
+
+class AsyncWorkflowMixin:
+    """
+    Async API of `djpieuvre.core.Workflow`, built on the Django async ORM.
+    Processes and tasks are read and written with the async ORM, and task assignment hooks can be
+    coroutines. Transitions run in a worker thread (see `asgiref.sync.sync_to_async`), so that
+    their hooks can use the sync ORM.
+    This thread is thread sensitive (the `sync_to_async` default): transitions share the thread,
+    and thus the database connection and transaction, of the other sync code of the request.
+    Transitions of concurrent tasks of the same request then run one at a time, but hooks see
+    the rows written by the caller in its transaction.
+    """
+
+    @classmethod
+    async def aget_instance(cls, model, initial_state=None):
+        """
+        Async version of `get_instance`: the process is read or created with the async ORM.
+        """
+        if not cls.persist or not model.pk:
+            return cls(model, initial_state)
+
+        if isinstance(model, PieuvreProcess):
+            key = (model.content_type_id, model.object_id, cls.name)
+        else:
+            content_type = await aget_content_type(model)
+            key = (content_type.pk, model.pk, cls.name)
+
+        identity_map = get_identity_map()
+        workflow = identity_map.get(key) if identity_map is not None else None
+        if workflow is not None:
+            workflow._adopt_process(model)
+            return workflow
+
+        if isinstance(model, PieuvreProcess):
+            await model.aget_process_target()
+        else:
+            model = await cls._aget_process(model, content_type, initial_state)
+        workflow = cls(model)
+        if identity_map is not None:
+            identity_map.add(key, workflow)
+        return workflow
+
+    @classmethod
+    async def _aget_process(cls, target, content_type, initial_state=None):
+        """
+        Return the process of the target, read or created with the async ORM
+        (see `Workflow.__init__`).
+        """
+        if not getattr(cls, "states", None):
+            raise ValueError("States must be defined on the workflow")
+
+        kwargs, defaults = cls._get_process_fields(
+            target, content_type, initial_state or cls._get_default_initial_state()
+        )
+
+        process = None
+        processes = cls._get_prefetched_processes(target)
+        if processes is not None:
+            process = cls._find_process(processes)
+        elif cls.lazy_persist:
+            process = await PieuvreProcess.objects.filter(**kwargs).afirst()
+
+        if process is None:
+            if cls.lazy_persist:
+                process = PieuvreProcess(**kwargs, **defaults)
+            else:
+                try:
+                    process, _ = await PieuvreProcess.objects.aget_or_create(
+                        defaults=defaults, **kwargs
+                    )
+                except IntegrityError:
+                    process = await PieuvreProcess.objects.aget(**kwargs)
+
+        # Workflow.__init__ must not load the target synchronously
+        process.process_target = target
+        return process
+
+    async def arun_transition(self, name, *args, **kwargs):
+        """
+        Async version of `run_transition`.
+        """
+        return await sync_to_async(self.run_transition)(name, *args, **kwargs)
+
+    async def aadvance_workflow(self):
+        """
+        Async version of `advance_workflow`.
+        Automatic transitions run in memory and the process is saved once they are all done,
+        in a single transaction (as with `deferred_save`). Assignment hooks can be coroutines,
+        or return querysets which are evaluated with the async ORM.
+        """
+        retries = get_setting("PROCESS_UPDATE_RETRIES")
+        for attempt in itertools.count():
+            try:
+                return await self._aadvance_workflow_until_manual()
+            except StaleProcess:
+                if attempt >= retries:
+                    raise
+                await self.model.arefresh_from_db()
+
+    async def _aadvance_workflow_until_manual(self):
+        transition = await sync_to_async(self._run_deferred_automatic_transitions)()
+        if transition:
+            await self._acreate_task(transition)
+
+    async def _acreate_task(self, transition):
+        """
+        Async version of `_advance_workflow` for a manual transition creating a task.
+        """
+        source_state = transition["source"]
+        if not self.is_persisted:
+            await sync_to_async(self._persist_process)()
+        users, groups = await self._aget_task_assignees(transition)
+
+        task, _ = await PieuvreTask.aget_or_create_open(
+            self.model,
+            source_state,
+            self._get_state_display(source_state),
+            repr_snapshot=self._get_repr_snapshot(),
+        )
+        await task.aassign(transition, users=users, groups=groups)
+
+    async def _aget_task_assignees(self, transition):
+        """
+        Async version of `_get_task_assignees`, returning primary keys.
+        Hooks (and `default_group` or `default_user`) are awaited if they are coroutines.
+        """
+        groups, users = set(), set()
+        assign_user, assign_group, _ = self._get_assignment_hooks(transition)
+        results = acall_hooks((*assign_group, *assign_user), tuple(transition.items()))
+        i = 0
+        async for pks in results:
+            (groups if i < len(assign_group) else users).update(pks)
+            i += 1
+
+        if not users and not groups:
+            # Fallback to default assignment
+            assign_group = getattr(self, "default_group", None)
+            if assign_group:
+                groups = await aget_pks(await acall_hook(assign_group))
+            assign_user = getattr(self, "default_user", None)
+            if assign_user:
+                users = await aget_pks(await acall_hook(assign_user))
+
+        return users, groups
+
+    async def aget_authorized_transitions(
+        self,
+        state: typing.Optional[str] = None,
+        user: typing.Optional[settings.AUTH_USER_MODEL] = None,
+        snapshot: typing.Optional[AuthorizationSnapshot] = None,
+    ):
+        """
+        Async version of `get_authorized_transitions`.
+        """
+        available_transitions, snapshot = self._get_authorization_context(
+            state, user, snapshot
+        )
+        if snapshot is None:
+            return available_transitions
+
+        return [
+            trans
+            for trans in available_transitions
+            if not trans.get("manual", False)
+            or await self._ais_assigned(trans, snapshot)
+        ]
+
+    async def _ais_assigned(self, transition, snapshot):
+        """
+        Async version of `_is_assigned`.
+        """
+        assign_user, assign_group, key = self._get_assignment_hooks(transition)
+        if key in snapshot.transitions:
+            return snapshot.transitions[key]
+
+        assigned = False
+        results = acall_hooks((*assign_user, *assign_group), tuple(transition.items()))
+        try:
+            i = 0
+            async for pks in results:
+                if i < len(assign_user):
+                    assigned = snapshot.user.pk in pks
+                else:
+                    assigned = bool((await snapshot.aget_group_ids()).intersection(pks))
+                if assigned:
+                    break
+                i += 1
+        finally:
+            # Finalize the generator now rather than when it is garbage collected
+            await results.aclose()
+
+        if key is not None:
+            snapshot.transitions[key] = assigned
+        return assigned
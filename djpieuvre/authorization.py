@@ -0,0 +1,75 @@
+from functools import cached_property
+
+from djpieuvre.identity import get_identity_map
+
+
+class AuthorizationSnapshot:
+    """
+    What a user is allowed to do, computed once and shared between workflow instances
+    (e.g. the objects of a list), so that permissions, group memberships and assignment hooks
+    are not evaluated again for every workflow.
+    Permissions are read from the `get_all_permissions` of the authentication backends. Others are
+    checked with `has_perm`, since backends may grant permissions they do not list.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        # Whether the user is assigned to a manual transition, keyed by
+        # (workflow class, transition name). Only filled for transitions whose hooks do not
+        # depend on the workflow instance.
+        self.transitions = {}
+        # Result of `has_perm` for the permissions missing from `permissions`
+        self.checked_permissions = {}
+
+    @cached_property
+    def group_ids(self):
+        if not self.user or not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.groups.values_list("pk", flat=True))
+
+    async def aget_group_ids(self):
+        """
+        Async version of `group_ids`.
+        """
+        if "group_ids" not in self.__dict__:
+            if not self.user or not self.user.is_authenticated:
+                group_ids = frozenset()
+            else:
+                group_ids = frozenset(
+                    [pk async for pk in self.user.groups.values_list("pk", flat=True)]
+                )
+            self.__dict__["group_ids"] = group_ids
+        return self.group_ids
+
+    @cached_property
+    def permissions(self):
+        if not self.user or not self.user.is_active:
+            return frozenset()
+        return frozenset(self.user.get_all_permissions())
+
+    def has_perm(self, perm):
+        if self.user and self.user.is_active and self.user.is_superuser:
+            return True
+        if perm in self.permissions:
+            return True
+        if perm not in self.checked_permissions:
+            self.checked_permissions[perm] = bool(
+                self.user and self.user.has_perm(perm)
+            )
+        return self.checked_permissions[perm]
+
+
+def get_authorization_snapshot(user):
+    """
+    Return the authorization snapshot of the user. Within a workflow scope
+    (see `djpieuvre.identity.workflow_scope`), it is only computed once per user.
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return AuthorizationSnapshot(user)
+
+    key = getattr(user, "pk", None)
+    snapshot = identity_map.authorizations.get(key)
+    if snapshot is None:
+        snapshot = identity_map.authorizations[key] = AuthorizationSnapshot(user)
+    return snapshot
@@ -0,0 +1,187 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from djpieuvre.conf import get_setting
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+_MISSING = object()
+
+
+class BaseHookCache:
+    """
+    Storage for the results of the task assignment hooks.
+    Keys are (workflow name, workflow version, hook name, transition name) tuples, converted by
+    `make_key` before they are read or written.
+    """
+
+    def __init__(self, timeout=None):
+        # Number of seconds after which a result expires, None to keep results until cleared
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, key):
+        """
+        Return the key under which the result is stored. It is computed once per lookup and
+        passed to `get` and `set`.
+        """
+        return key
+
+    def get(self, key):
+        """
+        Return the cached value, or `_MISSING` if there is none.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, None, None)
+
+
+class LocalHookCache(BaseHookCache):
+    """
+    Process-local LRU cache.
+    """
+
+    def __init__(self, timeout=None, maxsize=256):
+        super().__init__(timeout)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (_MISSING, None))
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                value = _MISSING
+
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+class DjangoHookCache(BaseHookCache):
+    """
+    Cache backed by a Django cache, which can be shared between processes.
+    Clearing the cache increments a generation number that is part of every key,
+    so that all processes stop reading the previous results.
+    """
+
+    def __init__(self, timeout=None, alias="default", key_prefix="djpieuvre:hooks"):
+        super().__init__(timeout)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _get_generation(self):
+        return self.cache.get_or_set(f"{self.key_prefix}:generation", 0, None)
+
+    def make_key(self, key):
+        # The generation is read once per lookup, not by both get and set
+        digest = hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest()
+        return f"{self.key_prefix}:{self._get_generation()}:{digest}"
+
+    def get(self, key):
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def clear(self):
+        try:
+            self.cache.incr(f"{self.key_prefix}:generation")
+        except ValueError:
+            # The generation expired or was never set
+            self.cache.set(f"{self.key_prefix}:generation", 1, None)
+        self.hits = 0
+        self.misses = 0
+
+
+@functools.cache
+def get_hook_cache():
+    """
+    Return the hook cache configured by the `HOOK_CACHE` setting, or None if caching is disabled.
+    """
+    config = get_setting("HOOK_CACHE")
+    if not config:
+        return None
+
+    backend = import_string(config["BACKEND"])
+    return backend(timeout=config.get("TIMEOUT"), **config.get("OPTIONS", {}))
+
+
+def clear_hook_cache():
+    """
+    Invalidate all cached hook results.
+    """
+    cache = get_hook_cache()
+    if cache is not None:
+        cache.clear()
+
+
+@receiver(setting_changed)
+def reset_hook_cache(setting, **kwargs):
+    if setting == "DJPIEUVRE":
+        get_hook_cache.cache_clear()
+
+
+def _get_transition_name(transition):
+    # Hooks are given the transition as a tuple of items so that it is hashable
+    if isinstance(transition, tuple):
+        transition = dict(transition)
+    return transition.get("name") if isinstance(transition, dict) else transition
+
+
+def get_hook_key(workflow, func, transition):
+    """
+    Return the key of the result of a task assignment hook in the hook cache.
+    """
+    return (
+        type(workflow).name,
+        getattr(workflow, "version", 1),
+        func.__name__,
+        _get_transition_name(transition),
+    )
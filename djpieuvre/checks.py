@@ -0,0 +1,31 @@
+from django.apps import apps
+from django.core.checks import Error
+
+from djpieuvre.core import get_workflows
+
+
+def check_workflow_graphs(app_configs=None, **kwargs):
+    """
+    Report the workflows whose automatic transitions can never run properly: automatic transition
+    cycles and ambiguous automatic transitions (see `djpieuvre.transitions.WorkflowGraph`).
+    Unreachable states are only logged when the workflows are registered.
+    """
+    errors = []
+    for workflow_class in get_workflows():
+        if app_configs is not None and (
+            apps.get_containing_app_config(workflow_class.__module__) not in app_configs
+        ):
+            continue
+
+        version = getattr(workflow_class, "version", 1)
+        for error in workflow_class.get_workflow_graph().errors:
+            errors.append(
+                Error(
+                    f"Invalid workflow {workflow_class.name} version {version}: {error}",
+                    hint="Add conditions or make transitions manual so that a single "
+                    "automatic transition can run from each state.",
+                    obj=workflow_class,
+                    id="djpieuvre.E001",
+                )
+            )
+    return errors
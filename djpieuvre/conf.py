@@ -0,0 +1,35 @@
+from django.conf import settings
+
+# Settings are read from the `DJPIEUVRE` dictionary of the Django settings
+DEFAULTS = {
+    # Storage of the results of the task assignment hooks declared with `cache=True`, e.g.
+    # {"BACKEND": "djpieuvre.cache.DjangoHookCache", "TIMEOUT": 300,
+    #  "OPTIONS": {"alias": "default"}}.
+    # `LocalHookCache` is only invalidated in the current process: with several workers, other
+    # workers keep their results until they expire. Caching is disabled by default.
+    "HOOK_CACHE": None,
+    # Set to a number of tasks per page to paginate the task list with a cursor
+    # (see `TaskCursorPagination`). Otherwise, the DRF default pagination is used.
+    "TASK_PAGE_SIZE": None,
+    # Cache of the open task counts of each user (see `TaskViewSet.counts`).
+    # Counts are invalidated when tasks are assigned or completed. Set to None to disable caching.
+    "TASK_COUNTS_CACHE": {"ALIAS": "default", "TIMEOUT": 30},
+    # Set to True to store the `task_repr` of the target on its tasks when they are created,
+    # so that the task list does not load the targets (see `PieuvreTask.refresh_repr_snapshot`).
+    "TASK_REPR_SNAPSHOT": False,
+    # Number of times `Workflow.advance_workflow` starts again from the current state of the process
+    # when the process was concurrently modified.
+    "PROCESS_UPDATE_RETRIES": 3,
+    # Set to e.g. {"MAX_WORKERS": 8, "TIMEOUT": 10} to evaluate the task assignment hooks of a
+    # transition concurrently, in a pool of MAX_WORKERS threads (or with asyncio.gather in the
+    # async API). HookTimeout is raised if they do not complete within TIMEOUT seconds. Hooks then
+    # run outside of the transaction of the caller, on their own database connections.
+    "HOOK_EXECUTOR": None,
+}
+
+
+def get_setting(name):
+    """
+    Return a django-pieuvre setting, or its default value if it is not set.
+    """
+    return getattr(settings, "DJPIEUVRE", {}).get(name, DEFAULTS[name])
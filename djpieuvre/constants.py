@@ -7,6 +7,14 @@ TASK_STATES = Choices(
     ("DONE", "done", "Done"),
 )
 
+# Principals a task can be assigned to. Tasks that are not assigned to any user or group
+# are available to everyone.
+TASK_PRINCIPAL_TYPES = Choices(
+    ("USER", "user", "User"),
+    ("GROUP", "group", "Group"),
+    ("EVERYONE", "everyone", "Everyone"),
+)
+
 ON_TASK_ASSIGN_USER_HOOK = "_on_task_assign_user_hook"
 ON_TASK_ASSIGN_GROUP_HOOK = "_on_task_assign_group_hook"
 
@@ -1,35 +1,56 @@
+import itertools
 import logging
 import typing
 from collections import defaultdict
+from types import MappingProxyType
 
 from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.conf import settings
+from django.utils.timezone import now
 from pieuvre import Workflow as PieuvreWorkflow
 from pieuvre.exceptions import (
+    ForbiddenTransition,
     TransitionAmbiguous,
     TransitionUnavailable,
     CircularWorkflowError,
 )
 
+from djpieuvre.async_api import AsyncWorkflowMixin
+from djpieuvre.authorization import AuthorizationSnapshot, get_authorization_snapshot
+from djpieuvre.conf import get_setting
 from djpieuvre.constants import (
     ON_TASK_ASSIGN_GROUP_HOOK,
     ON_TASK_ASSIGN_USER_HOOK,
     TASK_STATES,
+    WORKFLOW_PERM_SUFFIX_READ,
     WORKFLOW_PERM_SUFFIX_WRITE,
     WORKFLOW_PERM_PREFIX,
 )
-from djpieuvre.exceptions import WorkflowDoesNotExist
+from djpieuvre.executor import call_hooks
+from djpieuvre.exceptions import StaleProcess, WorkflowDoesNotExist
+from djpieuvre.identity import get_identity_map
+from djpieuvre.metadata import WorkflowMetadata
 from djpieuvre.mixins import WorkflowEnabled
 from djpieuvre.models import PieuvreProcess, PieuvreTask
-from djpieuvre.utils import get_app_name, camel_to_snake
+from djpieuvre.transitions import TransitionIndex, WorkflowGraph
+from djpieuvre.utils import (
+    batched,
+    camel_to_snake,
+    get_app_name,
+    get_permission_codenames,
+    get_pks,
+    get_repr_snapshot,
+)
 
 logger = logging.getLogger(__name__)
 _workflows = defaultdict(dict)
+# Latest registered version of each workflow name
+_latest_versions = {}
 
 
-class Workflow(PieuvreWorkflow):
+class Workflow(AsyncWorkflowMixin, PieuvreWorkflow):
     """
     A persisted workflow with an associated PieuvreProcess model.
     """
@@ -42,14 +63,23 @@ class Workflow(PieuvreWorkflow):
     # Otherwise, first element of the states list is used.
     initial_state = None
     # Workflow versions can coexist.
-    # To implement this, the `name` property should be overridden so that different workflow versions share
-    # the same name.
+    # To implement this, the `name` property should be overridden so that different workflow
+    # versions share the same name.
     version = 1
     extra_enabled_hooks_and_checks = (
         ON_TASK_ASSIGN_GROUP_HOOK,
         ON_TASK_ASSIGN_USER_HOOK,
     )
     fancy_name = None
+    # If lazy_persist is True, the PieuvreProcess is only kept in memory until the workflow
+    # advances (a transition is run or a task is created), so that reading workflows does not write.
+    lazy_persist = False
+    # If deferred_save is True, chains of automatic transitions run in memory in a single
+    # transaction and the process is saved once the chain is over. Hooks still see each
+    # intermediate state.
+    deferred_save = False
+    # If True, transitions do not save the process (used to run many transitions in a row)
+    _defer_save = False
 
     def __init_subclass__(cls, **kwargs):
         """
@@ -66,9 +96,11 @@ class Workflow(PieuvreWorkflow):
             if self.state_field_name != PieuvreProcess.STATE_FIELD_NAME:
                 raise ValueError("State field must not be set on a persisted workflow")
 
-            # If the target model is not persisted, then we cannot create a PieuvreProcess instance in database
-            # FIXME: we could only save the PieuvreProcess later on
-            if not model.pk:
+            # If the target model is not persisted, then we cannot create a PieuvreProcess
+            # instance in database. A process may only be kept in memory (see `lazy_persist`).
+            if not model.pk and not (
+                self.lazy_persist and isinstance(model, PieuvreProcess)
+            ):
                 raise ValueError("model must be persisted before workflow is called")
 
             # Do some magic: if provided model is a PieuvreProcess, fetch the target model,
@@ -82,7 +114,8 @@ class Workflow(PieuvreWorkflow):
                 states = getattr(self, "states", None)
 
                 if not states:
-                    # States must be defined because we need to instantiate the PieuvreProcess with an initial state
+                    # States must be defined because we need to instantiate the PieuvreProcess
+                    # with an initial state
                     raise ValueError("States must be defined on the workflow")
 
                 if not initial_state:
@@ -90,111 +123,353 @@ class Workflow(PieuvreWorkflow):
                     initial_state = self.get_initial_state()
 
                 # Override model with the PieuvreProcess
-                # FIXME: we should not save the object here so that it is only saved if the workflow advances
-
-                # First let's try to see if the process has been prefetched
-                if hasattr(self.process_target, "processes"):
-                    processes = [
-                        p
-                        for p in getattr(self.process_target, "processes")
-                        if p.workflow_name == self.__class__.name
-                    ]
-                    if processes:
-                        model = processes[0]
+                # First let's try to see if the processes have been prefetched
+                processes = self._get_prefetched_processes(self.process_target)
+                if processes is not None:
+                    model = self._find_process(processes)
 
                 if model is None:
-                    kwargs = {
-                        "content_type": ContentType.objects.get_for_model(
-                            self.process_target
-                        ),
-                        "object_id": self.process_target.pk,
-                        "workflow_name": self.__class__.name,
-                    }
-
-                    try:
-                        # when get_or_create is executed in concurrent call, an integrity error would be raised to
-                        # alert about an integrity violation
-                        # a PieuvreProcess has an uniqueness constraint on (content_type, object_id, workflow_name)
-                        kwargs["defaults"] = {
-                            PieuvreProcess.STATE_FIELD_NAME: initial_state,
-                            "workflow_version": getattr(self, "version", 1),
-                        }
-                        model, _ = PieuvreProcess.objects.get_or_create(**kwargs)
-                    except IntegrityError as e:
-                        model = PieuvreProcess.objects.get(**kwargs)
+                    kwargs, defaults = self._get_process_fields(
+                        self.process_target,
+                        ContentType.objects.get_for_model(self.process_target),
+                        initial_state,
+                    )
+
+                    if self.lazy_persist:
+                        # Do not save the process here so that it is only saved if the workflow
+                        # advances. If processes were prefetched, we already know it does not exist.
+                        if processes is None:
+                            model = PieuvreProcess.objects.filter(**kwargs).first()
+                        if model is None:
+                            model = PieuvreProcess(**kwargs, **defaults)
+                    else:
+                        try:
+                            # when get_or_create is executed in concurrent call, an integrity error
+                            # would be raised to alert about an integrity violation
+                            # a PieuvreProcess has an uniqueness constraint on
+                            # (content_type, object_id, workflow_name)
+                            model, _ = PieuvreProcess.objects.get_or_create(
+                                defaults=defaults, **kwargs
+                            )
+                        except IntegrityError:
+                            model = PieuvreProcess.objects.get(**kwargs)
 
         super().__init__(model)
 
+    @classmethod
+    def get_instance(cls, model, initial_state=None):
+        """
+        Return the workflow of the given target or PieuvreProcess.
+        Within a `workflow_scope`, a persisted workflow is only built once per target and
+        the same instance is returned afterwards.
+        """
+        identity_map = get_identity_map()
+        if identity_map is None or not cls.persist or not model.pk:
+            return cls(model, initial_state)
+
+        if isinstance(model, PieuvreProcess):
+            key = (model.content_type_id, model.object_id, cls.name)
+        else:
+            content_type = ContentType.objects.get_for_model(model)
+            key = (content_type.pk, model.pk, cls.name)
+
+        workflow = identity_map.get(key)
+        if workflow is None:
+            workflow = cls(model, initial_state)
+            identity_map.add(key, workflow)
+        else:
+            workflow._adopt_process(model)
+        return workflow
+
+    @classmethod
+    def _get_process_fields(cls, target, content_type, initial_state):
+        """
+        Return the lookup of the process of the target and the defaults it is created with.
+        """
+        kwargs = {
+            "content_type": content_type,
+            "object_id": target.pk,
+            "workflow_name": cls.name,
+        }
+        defaults = {
+            PieuvreProcess.STATE_FIELD_NAME: initial_state,
+            "workflow_version": getattr(cls, "version", 1),
+        }
+        return kwargs, defaults
+
+    @classmethod
+    def _find_process(cls, processes):
+        """
+        Return the process of this workflow among the processes of a target, or None.
+        """
+        return next((p for p in processes if p.workflow_name == cls.name), None)
+
+    def _adopt_process(self, model):
+        """
+        Use the given process if it is a fresher copy of the process of the workflow.
+        """
+        if (
+            isinstance(model, PieuvreProcess)
+            and model is not self.model
+            and (not self.is_persisted or model.revision >= self.model.revision)
+        ):
+            # The process was loaded again (e.g. through a task): keep the caller's instance
+            # in sync with the workflow rather than working on two copies of the process
+            self.model = model
+
+    @staticmethod
+    def _get_prefetched_processes(target):
+        """
+        Return the processes of the target if they were prefetched
+        (see `WorkflowEnabledQuerySet.with_workflow_processes`), None otherwise.
+        """
+        relation = getattr(target, "workflow_processes_relation", None)
+        if not relation:
+            return None
+
+        prefetched = getattr(target, "_prefetched_objects_cache", {})
+        if relation in prefetched:
+            return prefetched[relation]
+
+        # Processes may also have been attached manually as a plain list
+        processes = getattr(target, relation, None)
+        if isinstance(processes, (list, tuple)):
+            return processes
+        return None
+
+    @property
+    def is_persisted(self):
+        """
+        Return False if the process of this workflow is only kept in memory (see `lazy_persist`).
+        """
+        return not self.persist or self.model.pk is not None
+
+    def _persist_process(self):
+        """
+        Save the process if it was only kept in memory so far (see `lazy_persist`).
+        Return True if the process was inserted.
+        If the process was concurrently persisted, the workflow switches to the persisted process
+        and StaleProcess is raised: what was done in memory did not start from its state.
+        """
+        if self.is_persisted:
+            return False
+
+        try:
+            with transaction.atomic():
+                self.model.save(force_insert=True)
+            return True
+        except IntegrityError:
+            # Someone else persisted the process in the meantime
+            self.model = PieuvreProcess.objects.get(
+                content_type_id=self.model.content_type_id,
+                object_id=self.model.object_id,
+                workflow_name=self.model.workflow_name,
+            )
+            raise StaleProcess(
+                f"Process {self.model.pk} was concurrently created by another writer"
+            )
+
+    def finalize_transition(self, transition):
+        if self._defer_save:
+            # The process is saved by the caller once all transitions have been run
+            self.update_transition_date(transition)
+            return
+
+        if not isinstance(self.model, PieuvreProcess):
+            super().finalize_transition(transition)
+            return
+
+        self.update_transition_date(transition)
+        self._save_process()
+
+    def _save_process(self):
+        # A lazy process is persisted the first time the workflow advances
+        if not self._persist_process():
+            self._update_process(fields=("state", "data"))
+
+    def _update_process(self, fields=()):
+        """
+        Save the given fields of the process and increment its revision, only if the revision
+        did not change since the process was read (compare-and-swap), so that concurrent updates
+        are detected without locking the process.
+        Raise StaleProcess if the process was modified in the meantime.
+        """
+        process = self.model
+        revision = process.revision
+        process.edited_at = now()
+        values = {field: getattr(process, field) for field in (*fields, "edited_at")}
+
+        updated = PieuvreProcess.objects.filter(
+            pk=process.pk, revision=revision
+        ).update(revision=revision + 1, **values)
+        if not updated:
+            raise StaleProcess(
+                f"Process {process.pk} was modified since revision {revision}"
+            )
+        process.revision = revision + 1
+
     def _advance_workflow(self, transition=None):
 
         transition = transition or self._get_next_transition()
-        # If `auto_advance` is True it means that the transition, despite being manual, should not create a task
-        # and can be auto advanced. This is useful for transitions that must not be triggered automatically
-        # but should not be automatically assigned to users
+        # If `auto_advance` is True it means that the transition, despite being manual, should not
+        # create a task and can be auto advanced. This is useful for transitions that must not be
+        # triggered automatically but should not be automatically assigned to users
         manual_transition = transition.get("manual", False)
         create_task = transition.get("create_task", True)
 
         if manual_transition and create_task:
             # Manual transition: we must not advance the workflow, only create a task
             source_state = transition["source"]
+            source_state_name = self._get_state_display(source_state)
+
+            self._persist_process()
+            # Assignees are found first so that no task is created if a hook fails
+            users, groups = self._get_task_assignees(transition)
+
+            # If another writer advanced the process concurrently, StaleProcess is raised
+            # and the task is not created
+            task, _ = PieuvreTask.get_or_create_open(
+                self.model,
+                source_state,
+                source_state_name,
+                repr_snapshot=self._get_repr_snapshot(),
+            )
+            task.assign(transition, users=users, groups=groups)
+        elif not manual_transition:
+            # No need for run_transition because this comes from _get_next_transition()
+            getattr(self, transition["name"])()
+        # Else, the transition is manual but does not create a task, so we do nothing
 
-            if hasattr(self.states, "for_value"):
-                # If states are django extended choices, then use it
-                source_state_name = self.states.for_value(source_state).display
-            else:
-                source_state_name = source_state
+    def _get_repr_snapshot(self):
+        """
+        Return the representation of the target to store on its tasks, if enabled
+        (see the `TASK_REPR_SNAPSHOT` setting).
+        """
+        if not get_setting("TASK_REPR_SNAPSHOT"):
+            return None
+        return get_repr_snapshot(self.process_target)
 
-            with transaction.atomic():
-                # We need a lock to avoid concurrency issues
-                obj = PieuvreProcess.objects.select_for_update().get(pk=self.model.pk)
-                task, _ = PieuvreTask.objects.get_or_create(
-                    process=self.model,
-                    task=source_state,
-                    state=TASK_STATES.CREATED,
-                    defaults={"name": source_state_name},
-                )
+    def _get_state_display(self, state):
+        if hasattr(self.states, "for_value"):
+            # If states are django extended choices, then use it
+            return self.states.for_value(state).display
+        return state
 
-            # Check if the workflow gives us insights about whom to assign
-            groups, users = [], []
-            assign_group = self._on_task_assign_group_hook.get(transition["name"])
+    def _get_task_assignees(self, transition):
+        """
+        Return the users and groups a task created for the given transition must be assigned to.
+        """
+        # Check if the workflow gives us insights about whom to assign
+        groups, users = [], []
+        assign_user, assign_group, _ = self._get_assignment_hooks(transition)
+        # Hooks may be evaluated concurrently (see the `HOOK_EXECUTOR` setting)
+        results = call_hooks((*assign_group, *assign_user), tuple(transition.items()))
+        for i, result in enumerate(results):
+            (groups if i < len(assign_group) else users).extend(result)
+
+        if not users and not groups:
+            # Fallback to default assignment
+            assign_group = getattr(self, "default_group", None)
             if assign_group:
-                for func in assign_group:
-                    groups.extend(func(tuple(transition.items())))
-            assign_user = self._on_task_assign_user_hook.get(transition["name"])
+                groups = assign_group()
+            assign_user = getattr(self, "default_user", None)
             if assign_user:
-                for func in assign_user:
-                    users.extend(func(tuple(transition.items())))
-
-            if not users and not groups:
-                # Fallback to default assignment
-                assign_group = getattr(self, "default_group", None)
-                if assign_group:
-                    groups = assign_group()
-                assign_user = getattr(self, "default_user", None)
-                if assign_user:
-                    users = assign_user()
+                users = assign_user()
+
+        return users, groups
+
+    def _run_automatic_transitions(self):
+        """
+        Run the automatic transitions until a manual transition is reached or the workflow cannot
+        advance. Return the manual transition if it requires a task to be created, None otherwise.
+        """
+        seen_transitions = set()
+
+        while True:
+            self._run_automatic_path()
+            try:
+                transition = self._get_next_transition()
+            except TransitionUnavailable:
+                return None
+
+            if transition.get("manual", False):
+                return transition if transition.get("create_task", True) else None
+
+            if transition["name"] in seen_transitions:
+                # Avoid infinite loop and abort
+                raise CircularWorkflowError()
+            seen_transitions.add(transition["name"])
 
-            task.assign(transition, users=users, groups=groups)
-        elif not manual_transition:
-            # No need for run_transition because this comes from _get_next_transition()
             getattr(self, transition["name"])()
-        # Else, the transition is manual but does not create a task, so we do nothing
+
+    def _run_automatic_path(self):
+        """
+        Run the automatic transitions that are always run from the current state, as found by the
+        analysis of the workflow graph, without looking for the next transition at each step.
+        The path stops as soon as the process does not follow it (e.g. because of conditions
+        the analysis cannot see): the caller then looks for the next transition.
+        """
+        path = self.get_workflow_graph().get_automatic_path(self._get_model_state())
+        for transition in path:
+            state = self._get_model_state()
+            if not self._check_state(
+                transition["source"], state
+            ) or transition not in self.get_available_transitions(state, False):
+                return
+            getattr(self, transition["name"])()
+
+    def _run_deferred_automatic_transitions(self):
+        """
+        Run the automatic transitions in memory and save the process once they are all done
+        (see `deferred_save`). Return the manual transition reached, if a task must be created
+        for it.
+        """
+        with transaction.atomic():
+            state = self.state
+            self._defer_save = True
+            try:
+                transition = self._run_automatic_transitions()
+            finally:
+                self._defer_save = False
+
+            if self.state != state:
+                self._save_process()
+
+        return transition
 
     def advance_workflow(self):
         """
         Advance the workflow if the transition is automatic, or create a manual task if the
         transition is meant to be manual.
         If the transition is manual, the task must be completed for the workflow to advance.
+        If the process is concurrently modified, start again from its current state
+        (see the `PROCESS_UPDATE_RETRIES` setting).
         """
+        retries = get_setting("PROCESS_UPDATE_RETRIES")
+        for attempt in itertools.count():
+            try:
+                return self._advance_workflow_until_manual()
+            except StaleProcess:
+                if attempt >= retries:
+                    raise
+                self.model.refresh_from_db()
+
+    def _advance_workflow_until_manual(self):
+        if self.deferred_save:
+            transition = self._run_deferred_automatic_transitions()
+            if transition:
+                self._advance_workflow(transition)
+            return
 
         can_advance = True
         seen_transitions = set()
 
         while can_advance:
+            self._run_automatic_path()
             # if the current transition is manual, we can advance only once
             try:
                 next_transition = self._get_next_transition()
-            except TransitionUnavailable as e:
+            except TransitionUnavailable:
                 can_advance = False
             else:
                 is_next_manual = next_transition.get("manual", False)
@@ -211,44 +486,210 @@ class Workflow(PieuvreWorkflow):
         self,
         state: typing.Optional[str] = None,
         user: typing.Optional[settings.AUTH_USER_MODEL] = None,
+        snapshot: typing.Optional[AuthorizationSnapshot] = None,
     ):
-        return self._get_authorized_transitions(state, user)
+        """
+        Return the available transitions the user is allowed to run.
+        A `snapshot` of the user authorizations can be given to share them between workflows.
+        """
+        return self._get_authorized_transitions(state, user, snapshot)
 
     def _get_authorized_transitions(
         self,
         state: typing.Optional[str] = None,
         user: typing.Optional[settings.AUTH_USER_MODEL] = None,
+        snapshot: typing.Optional[AuthorizationSnapshot] = None,
     ):
+        available_transitions, snapshot = self._get_authorization_context(
+            state, user, snapshot
+        )
+        if snapshot is None:
+            return available_transitions
+
+        return [
+            trans
+            for trans in available_transitions
+            if not trans.get("manual", False) or self._is_assigned(trans, snapshot)
+        ]
+
+    def _get_authorization_context(self, state, user, snapshot):
+        """
+        Return the available transitions and the snapshot of the user authorizations used to
+        check the manual ones, which is None if there is no user to check.
+        """
         available_transitions = self.get_available_transitions(state, False)
 
         if not user:
-            return available_transitions
+            return available_transitions, None
 
-        authorized_transitions = []
-        user_groups = user.groups.all()
+        if snapshot is None:
+            snapshot = get_authorization_snapshot(user)
+        return available_transitions, snapshot
 
-        for trans in available_transitions:
-            if not trans.get("manual", False):
-                authorized_transitions.append(trans)
-                continue
+    def _is_assigned(self, transition, snapshot):
+        """
+        Return True if the user of the snapshot is assigned to the manual transition by the hooks.
+        The result is kept in the snapshot if the hooks do not depend on the workflow instance.
+        """
+        assign_user, assign_group, key = self._get_assignment_hooks(transition)
+        if key in snapshot.transitions:
+            return snapshot.transitions[key]
+
+        # Only primary keys are compared, so that querysets are not loaded as model instances.
+        # Hooks may be evaluated concurrently (see the `HOOK_EXECUTOR` setting)
+        results = call_hooks(
+            (*assign_user, *assign_group), tuple(transition.items()), evaluate=get_pks
+        )
+        assigned = any(
+            (
+                snapshot.user.pk in pks
+                if i < len(assign_user)
+                else snapshot.group_ids.intersection(pks)
+            )
+            for i, pks in enumerate(results)
+        )
 
-            assign_group = self._on_task_assign_group_hook.get(trans["name"], [])
-            assign_user = self._on_task_assign_user_hook.get(trans["name"], [])
-            authorized_groups = []
-            authorized_users = []
+        if key is not None:
+            snapshot.transitions[key] = assigned
+        return assigned
 
-            for func in assign_group:
-                authorized_groups.extend(func(tuple(trans.items())))
+    def _get_assignment_hooks(self, transition):
+        """
+        Return the user and group assignment hooks of the transition, and the key of their result
+        in authorization snapshots, which is None if a hook depends on the workflow instance.
+        """
+        assign_user = self._on_task_assign_user_hook.get(transition["name"], [])
+        assign_group = self._on_task_assign_group_hook.get(transition["name"], [])
+        shared = all(
+            getattr(func, "shared", False) for func in (*assign_user, *assign_group)
+        )
+        key = (type(self), transition["name"]) if shared else None
+        return assign_user, assign_group, key
 
-            for func in assign_user:
-                authorized_users.extend(func(tuple(trans.items())))
+    @classmethod
+    def _get_default_initial_state(cls):
+        """
+        Return the initial state of the workflow without instantiating it.
+        """
+        if cls.initial_state:
+            return cls.initial_state
 
-            if user in authorized_users or set(user_groups).intersection(
-                authorized_groups
-            ):
-                authorized_transitions.append(trans)
+        # Assume states are given in order
+        state = cls.states[0]
+        # Extended choices are (value, display) tuples
+        return state[0] if isinstance(state, tuple) else state
 
-        return authorized_transitions
+    @classmethod
+    def bulk_start(
+        cls,
+        targets: typing.Iterable[WorkflowEnabled],
+        initial_state: typing.Optional[str] = None,
+        advance: bool = True,
+        batch_size: int = 1000,
+    ):
+        """
+        Start the workflow on many targets at once.
+        Processes are created with `bulk_create`. If `advance` is True, the automatic transitions
+        are then run in a single transaction per batch: states are saved with `bulk_update` and the
+        resulting tasks are created in bulk.
+        Targets that already have a process for this workflow are left untouched.
+        Return the list of created processes.
+        """
+        if not cls.persist:
+            raise ValueError("Only persisted workflows can be started in bulk")
+
+        initial_state = initial_state or cls._get_default_initial_state()
+
+        processes = []
+        for batch in batched(targets, batch_size):
+            processes.extend(cls._bulk_start_batch(batch, initial_state, advance))
+        return processes
+
+    @classmethod
+    def _bulk_start_batch(cls, targets, initial_state, advance):
+        targets_by_id = {target.pk: target for target in targets}
+        lookup = {
+            "content_type": ContentType.objects.get_for_model(targets[0]),
+            "workflow_name": cls.name,
+        }
+
+        existing_ids = set(
+            PieuvreProcess.objects.filter(
+                object_id__in=targets_by_id, **lookup
+            ).values_list("object_id", flat=True)
+        )
+        new_ids = [pk for pk in targets_by_id if pk not in existing_ids]
+        if not new_ids:
+            return []
+
+        PieuvreProcess.objects.bulk_create(
+            [
+                PieuvreProcess(
+                    object_id=pk,
+                    workflow_version=getattr(cls, "version", 1),
+                    state=initial_state,
+                    **lookup,
+                )
+                for pk in new_ids
+            ],
+            ignore_conflicts=True,
+        )
+        # Primary keys are not returned when conflicts are ignored, so fetch the processes back
+        processes = list(PieuvreProcess.objects.filter(object_id__in=new_ids, **lookup))
+        for process in processes:
+            process.process_target = targets_by_id[process.object_id]
+
+        if advance:
+            cls._bulk_advance(processes)
+
+        return processes
+
+    @classmethod
+    def _bulk_advance(cls, processes):
+        """
+        Run the automatic transitions of the given processes and create their tasks, saving
+        everything in bulk.
+        Processes are saved with a compare-and-swap on their revision: StaleProcess is raised
+        and nothing is saved if one of them was concurrently modified.
+        """
+        with transaction.atomic():
+            # Advanced processes, by the revision they were read at
+            updated_processes, assignments = defaultdict(list), []
+            for process in processes:
+                workflow = cls(process)
+                state = workflow.state
+                workflow._defer_save = True
+                transition = workflow._run_automatic_transitions()
+
+                if workflow.state != state or transition:
+                    # Processes getting a task are also claimed, as in `get_or_create_open`
+                    updated_processes[process.revision].append(process)
+                    process.edited_at = now()
+                    process.revision += 1
+
+                if transition:
+                    source_state = transition["source"]
+                    task = PieuvreTask(
+                        process=process,
+                        task=source_state,
+                        state=TASK_STATES.CREATED,
+                        name=workflow._get_state_display(source_state),
+                        repr_snapshot=workflow._get_repr_snapshot(),
+                        **PieuvreTask.get_routing(process),
+                    )
+                    assignments.append(
+                        (task, *workflow._get_task_assignees(transition))
+                    )
+
+            for revision, batch in updated_processes.items():
+                updated = PieuvreProcess.objects.filter(revision=revision).bulk_update(
+                    batch, ["state", "data", "edited_at", "revision"]
+                )
+                if updated != len(batch):
+                    raise StaleProcess(
+                        "Processes were modified while they were advanced in bulk"
+                    )
+            PieuvreTask.bulk_create_and_assign(assignments)
 
     @classmethod
     def applies_to(cls, instance):
@@ -259,9 +700,15 @@ class Workflow(PieuvreWorkflow):
         """
         return True
 
-    def is_allowed(self, user, perm=WORKFLOW_PERM_SUFFIX_WRITE):
+    def is_allowed(
+        self,
+        user,
+        perm=WORKFLOW_PERM_SUFFIX_WRITE,
+        snapshot: typing.Optional[AuthorizationSnapshot] = None,
+    ):
         """
         Return True if the user or its group can access the workflow instance.
+        A `snapshot` of the user authorizations can be given to share them between workflows.
         """
         # Workflow without a target_model is allowed by default because it is not
         # related to a given instance (which might require some permissions).
@@ -272,22 +719,87 @@ class Workflow(PieuvreWorkflow):
         ):
             return True
 
-        perm = f"{WORKFLOW_PERM_PREFIX}_{camel_to_snake(self.perm_name)}_{perm}"
+        perm = self.get_permission_codename(perm)
 
         # Permissions are not mandatory: if it does not exist, assume the user
         # is allowed to access the workflow.
         if not self._is_permission_defined(perm):
             return True
 
-        return user.has_perm(f"{app_name}.{perm}")
+        snapshot = snapshot or get_authorization_snapshot(user)
+        return snapshot.has_perm(f"{app_name}.{perm}")
 
     def _is_permission_defined(self, current_perm):
         """
         Return True if the permission exists.
         """
-        return any(
-            perm[0] == current_perm for perm in self.process_target._meta.permissions
-        )
+        return current_perm in get_permission_codenames(type(self.process_target))
+
+    @classmethod
+    def get_permission_codename(cls, perm=WORKFLOW_PERM_SUFFIX_WRITE):
+        """
+        Return the codename of the given permission (read or write) of this workflow.
+        """
+        codenames = cls.__dict__.get("_permission_codenames") or {}
+        if perm in codenames:
+            return codenames[perm]
+        return f"{WORKFLOW_PERM_PREFIX}_{camel_to_snake(cls.perm_name)}_{perm}"
+
+    @classmethod
+    def get_metadata(cls) -> WorkflowMetadata:
+        """
+        Return the metadata of this workflow class, computed when the workflow is registered.
+        """
+        metadata = cls.__dict__.get("_metadata")
+        if metadata is None:
+            metadata = cls._metadata = WorkflowMetadata(cls)
+        return metadata
+
+    @classmethod
+    def get_transition_index(cls) -> TransitionIndex:
+        """
+        Return the transition index of this workflow class, compiled when the workflow
+        is registered.
+        """
+        index = cls.__dict__.get("_transition_index")
+        if index is None:
+            index = cls._transition_index = TransitionIndex(cls)
+        return index
+
+    @classmethod
+    def get_workflow_graph(cls) -> WorkflowGraph:
+        """
+        Return the analysis of the graph of this workflow class, done when the workflow
+        is registered.
+        """
+        graph = cls.__dict__.get("_workflow_graph")
+        if graph is None:
+            graph = cls._workflow_graph = WorkflowGraph(cls, cls.get_transition_index())
+        return graph
+
+    @classmethod
+    def _get_transition_by_name(cls, name):
+        return cls.get_transition_index().get(name) or {}
+
+    def get_available_transitions(self, state=None, return_all=True):
+        """
+        Get the list of available transitions from a given state (or from the current state).
+        If `return_all` is False, transitions forbidden by their checks are filtered out.
+        """
+        state = state or self._get_model_state()
+        transitions = self.get_transition_index().for_source(state)
+
+        if return_all:
+            return list(transitions)
+
+        return [t for t in transitions if self._is_transition_allowed(t)]
+
+    def _is_transition_allowed(self, transition):
+        try:
+            self.check_transition_condition(transition)
+        except ForbiddenTransition:
+            return False
+        return True
 
     def _get_next_transition(self):
         """
@@ -296,9 +808,12 @@ class Workflow(PieuvreWorkflow):
         """
         state = self._get_model_state()
         transitions = self.get_available_transitions(state, return_all=False)
-        if len(transitions) > 1 and self._check_manual_transitions(transitions):
+        if len(transitions) == 1 or (
+            len(transitions) > 1 and self._check_manual_transitions(transitions)
+        ):
             return transitions[0]
 
+        # Let Pieuvre raise the appropriate error
         return super()._get_next_transition()
 
     def _check_manual_transitions(self, transitions):
@@ -335,13 +850,35 @@ def register(cls: typing.Type[Workflow]):
     """
     name = cls.name
     version = getattr(cls, "version", 1)
+
+    # Permission codenames are checked for every workflow instance
+    cls._permission_codenames = MappingProxyType(
+        {
+            perm: f"{WORKFLOW_PERM_PREFIX}_{camel_to_snake(cls.perm_name)}_{perm}"
+            for perm in (WORKFLOW_PERM_SUFFIX_READ, WORKFLOW_PERM_SUFFIX_WRITE)
+        }
+    )
+    # Compile the transitions once so that lookups do not scan the transitions list
+    cls._transition_index = TransitionIndex(cls)
+    # Check the graph now rather than when a process gets stuck.
+    # Errors are reported by the system checks (see `djpieuvre.checks`).
+    cls._workflow_graph = graph = WorkflowGraph(cls, cls._transition_index)
+    if graph.unreachable_states:
+        logger.warning(
+            f"Unreachable states in workflow {name} version {version}: "
+            + ", ".join(graph.unreachable_states)
+        )
+
     if name in _workflows and version in _workflows[name]:
         # This is probably an error, but leave it to the developer to decide
         logger.warning(f"Duplicated workflow {name} version {version}")
 
     _workflows[name][version] = cls
+    _latest_versions[name] = max(version, _latest_versions.get(name, version))
+    # Serializers read the metadata instead of introspecting the workflow class
+    cls._metadata = WorkflowMetadata(cls)
 
-    if hasattr(cls, "target_model"):
+    if cls.target_model is not None:
         # Also register the workflow on the model itself so that it can be easily found later on
         # This is especially useful to return all available workflows on a specific object
         if not issubclass(cls.target_model, WorkflowEnabled):
@@ -351,8 +888,33 @@ def register(cls: typing.Type[Workflow]):
         cls.target_model.register_workflow(cls)
 
 
+def get_workflows() -> typing.List[typing.Type[Workflow]]:
+    """
+    Return all the registered workflows, of all their versions.
+    """
+    return [cls for versions in _workflows.values() for cls in versions.values()]
+
+
 def get(workflow_name: str, workflow_version: int):
     """
     Given its name and version, returns a registered workflow, or None if it does not exist.
     """
-    return _workflows.get(workflow_name).get(workflow_version)
+    return _workflows.get(workflow_name, {}).get(workflow_version)
+
+
+def get_metadata(
+    workflow_name: str, workflow_version: typing.Optional[int] = None
+) -> WorkflowMetadata:
+    """
+    Return the metadata of a registered workflow, of its latest version if no version is given.
+    Raise WorkflowDoesNotExist if the workflow is not registered.
+    """
+    if workflow_version is None:
+        workflow_version = _latest_versions.get(workflow_name)
+
+    workflow_class = get(workflow_name, workflow_version)
+    if workflow_class is None:
+        raise WorkflowDoesNotExist(
+            f"Workflow {workflow_name} version {workflow_version} is not registered"
+        )
+    return workflow_class._metadata
@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+from django.core.cache import caches
+from django.db.models import Count
+
+from djpieuvre.conf import get_setting
+from djpieuvre.constants import TASK_STATES
+
+GENERATION_KEY = "djpieuvre:task-counts:generation"
+
+
+def _get_cache():
+    config = get_setting("TASK_COUNTS_CACHE")
+    if not config:
+        return None, None
+    return caches[config.get("ALIAS", "default")], config.get("TIMEOUT")
+
+
+def invalidate_task_counts():
+    """
+    Invalidate the cached task counts of all users.
+    Called whenever tasks are created, assigned or completed.
+    """
+    cache, _ = _get_cache()
+    if cache is None:
+        return
+
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # The generation was never set
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def count_open_tasks(queryset):
+    """
+    Count the open tasks of the queryset per workflow and per state with a single aggregation.
+    """
+    counts = {"total": 0, "workflows": defaultdict(lambda: {"total": 0, "states": {}})}
+    rows = (
+        queryset.filter(state=TASK_STATES.CREATED)
+        .order_by()
+        .values_list("workflow_name", "task")
+        .annotate(count=Count("pk"))
+    )
+    for workflow_name, state, count in rows:
+        counts["total"] += count
+        counts["workflows"][workflow_name]["total"] += count
+        counts["workflows"][workflow_name]["states"][state] = count
+
+    counts["workflows"] = dict(counts["workflows"])
+    return counts
+
+
+def get_open_task_counts(user, queryset):
+    """
+    Return the open task counts of the user, computed from the given queryset of tasks
+    the user can access. Counts are cached for a short time (see the `TASK_COUNTS_CACHE` setting).
+    """
+    cache, timeout = _get_cache()
+    if cache is None:
+        return count_open_tasks(queryset)
+
+    generation = cache.get_or_set(GENERATION_KEY, 0, None)
+    key = f"djpieuvre:task-counts:{generation}:{getattr(user, 'pk', None)}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_open_tasks(queryset)
+        cache.set(key, counts, timeout)
+    return counts
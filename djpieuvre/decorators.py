@@ -1,14 +1,131 @@
-from functools import lru_cache
+import functools
+import inspect
 
+from asgiref.sync import async_to_sync
+from django.db.models import QuerySet
 from pieuvre.core import BaseDecorator
 
+from djpieuvre.cache import (
+    _MISSING,
+    CacheInfo,
+    clear_hook_cache,
+    get_hook_cache,
+    get_hook_key,
+)
 from djpieuvre.constants import ON_TASK_ASSIGN_GROUP_HOOK, ON_TASK_ASSIGN_USER_HOOK
 
 
+def assignment_hook(func, cache=False, ids=False):
+    """
+    Wrap a task assignment hook.
+    If `cache` is True, its result is stored in the hook cache and shared by all instances of
+    the workflow class: the hook must then only depend on the transition, not on the workflow
+    instance.
+    If `ids` is True, only the primary keys of the returned users or groups are kept.
+    Hooks can be coroutine functions. Async APIs (such as `Workflow.aadvance_workflow`) call the
+    `acall` coroutine of the wrapper, which evaluates the result with the async ORM.
+    """
+    run = async_to_sync(func) if inspect.iscoroutinefunction(func) else func
+
+    @functools.wraps(func)
+    def wrapper(workflow, transition, *args, **kwargs):
+        # Imported here because workflows may be declared before the app registry is ready
+        from djpieuvre.utils import get_pks
+
+        hook_cache = get_hook_cache() if cache else None
+        if hook_cache is None:
+            result = run(workflow, transition, *args, **kwargs)
+            return get_pks(result) if ids else result
+
+        key = hook_cache.make_key(get_hook_key(workflow, func, transition))
+        value = hook_cache.get(key)
+        if value is _MISSING:
+            # Querysets are evaluated so that the result can be stored and reused
+            result = run(workflow, transition, *args, **kwargs)
+            value = list(get_pks(result) if ids else result)
+            hook_cache.set(key, value)
+        return value
+
+    async def acall(workflow, transition, *args, **kwargs):
+        from djpieuvre.utils import aget_pks
+
+        hook_cache = get_hook_cache() if cache else None
+        if hook_cache is not None:
+            key = hook_cache.make_key(get_hook_key(workflow, func, transition))
+            value = hook_cache.get(key)
+            if value is not _MISSING:
+                return value
+
+        result = func(workflow, transition, *args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        if ids:
+            result = await aget_pks(result)
+        if hook_cache is None:
+            return result
+
+        if isinstance(result, QuerySet):
+            value = [obj async for obj in result]
+        else:
+            value = list(result)
+        hook_cache.set(key, value)
+        return value
+
+    wrapper.acall = acall
+    wrapper.returns_ids = ids
+    # Cached results only depend on the transition, so they can be shared between workflow instances
+    wrapper.shared = cache
+    # Keep the lru_cache interface, which does nothing for hooks that are not cached
+    wrapper.cache_clear = clear_hook_cache if cache else _clear_nothing
+    wrapper.cache_info = functools.partial(_get_cache_info, cache)
+    return wrapper
+
+
+def _clear_nothing():
+    pass
+
+
+def _get_cache_info(cache):
+    hook_cache = get_hook_cache() if cache else None
+    if hook_cache is None:
+        return CacheInfo(0, 0, 0, 0)
+    return hook_cache.cache_info()
+
+
+async def acall_hook(func, *args):
+    """
+    Call a bound task assignment hook (or default assignment method) from an async API,
+    awaiting it if it is a coroutine.
+    """
+    acall = getattr(func, "acall", None)
+    if acall is not None:
+        return await acall(func.__self__, *args)
+
+    result = func(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
 class TaskBaseDecorator(BaseDecorator):
+    """
+    Pass `cache=True` to store the results of the decorated hook in the hook cache (see the
+    `HOOK_CACHE` setting) and share them between all instances of the workflow. Only hooks that
+    do not depend on the workflow instance (e.g. on `self.process_target`) may opt in.
+    Pass `ids=True` to only keep the primary keys of the returned users or groups: querysets are
+    then evaluated with `values_list("pk", flat=True)`, and tasks are assigned and authorized
+    without loading any user or group.
+    Hooks can also be coroutine functions, which async APIs await (see `assignment_hook`).
+    """
+
+    def __init__(self, state, cache=False, ids=False):
+        super().__init__(state)
+        self.cache = cache
+        self.ids = ids
+
     def __call__(self, func):
         func = super().__call__(func)
-        return lru_cache(maxsize=256)(func)
+        return assignment_hook(func, cache=self.cache, ids=self.ids)
 
 
 class OnTaskAssignGroup(TaskBaseDecorator):
@@ -20,9 +137,13 @@ class OnTaskAssignGroup(TaskBaseDecorator):
 
     .. code-block::
 
-       @on_task_assign_group(ROCKET_STATES.ON_LAUNCHPAD)
+       @on_task_assign_group(ROCKET_STATES.ON_LAUNCHPAD, cache=True)
        def groups_who_can_launch(self, result):
            return Group.objects.filter(name__contains="MISSION CONTROL")
+
+       @on_task_assign_group(ROCKET_STATES.ON_LAUNCHPAD, ids=True)
+       def group_ids_who_can_launch(self, result):
+           return Group.objects.filter(name__contains="ENGINEERING")
     """
 
     type = ON_TASK_ASSIGN_GROUP_HOOK
@@ -6,13 +6,25 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from djpieuvre import constants
+from djpieuvre.exceptions import ProcessConflict, StaleProcess
+from djpieuvre.identity import workflow_scope
 from djpieuvre.mixins import WorkflowEnabled
 from djpieuvre.models import PieuvreProcess
 from djpieuvre.serializers import InstanceWorkflowSerializer
 from djpieuvre.serializers import WorkflowSerializer, AdvanceWorkflowSerializer
 
 
-class WorkflowModelMixin:
+class WorkflowScopeMixin:
+    """
+    Build each workflow only once per request (see `djpieuvre.identity.workflow_scope`).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with workflow_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class WorkflowModelMixin(WorkflowScopeMixin):
     def get_workflows_serializer_class(self):
         return InstanceWorkflowSerializer
 
@@ -32,10 +44,10 @@ class WorkflowDoesNotExist(Exception):
     pass
 
 
-class AdvanceWorkflowMixin(object):
+class AdvanceWorkflowMixin(WorkflowScopeMixin):
     """
-    The aim of this mixin is to expose an endpoint that should help the frontend to advance a workflow (only from its
-    initial state to the next), starting from its PieuvreProcess.
+    The aim of this mixin is to expose an endpoint that should help the frontend to advance
+    a workflow (only from its initial state to the next), starting from its PieuvreProcess.
     This implementation only cares about the first state.
     """
 
@@ -63,10 +75,13 @@ class AdvanceWorkflowMixin(object):
         if not workflow.is_allowed(request.user, constants.WORKFLOW_PERM_SUFFIX_WRITE):
             return HttpResponseForbidden()
 
-        if transition := serializer.validated_data.get("transition"):
-            getattr(workflow, transition)()
-        else:
-            workflow.advance_workflow()
+        try:
+            if transition := serializer.validated_data.get("transition"):
+                getattr(workflow, transition)()
+            else:
+                workflow.advance_workflow()
+        except StaleProcess:
+            raise ProcessConflict()
 
         workflow_serializer = WorkflowSerializer(instance=workflow)
 
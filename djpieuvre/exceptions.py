@@ -1,2 +1,29 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
 class WorkflowDoesNotExist(Exception):
     pass
+
+
+class StaleProcess(Exception):
+    """
+    Raised when a process was modified by someone else since it was read.
+    """
+
+    pass
+
+
+class HookTimeout(Exception):
+    """
+    Raised when the task assignment hooks evaluated by the hook executor do not complete in time
+    (see the `HOOK_EXECUTOR` setting).
+    """
+
+    pass
+
+
+class ProcessConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The process was modified, please reload it."
+    default_code = "conflict"
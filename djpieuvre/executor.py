@@ -0,0 +1,90 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from djpieuvre.conf import get_setting
+from djpieuvre.decorators import acall_hook
+from djpieuvre.exceptions import HookTimeout
+from djpieuvre.utils import aget_pks
+
+
+@functools.cache
+def get_hook_executor():
+    """
+    Return the thread pool evaluating the task assignment hooks, or None if hooks are evaluated
+    sequentially (see the `HOOK_EXECUTOR` setting).
+    """
+    config = get_setting("HOOK_EXECUTOR")
+    if not config:
+        return None
+    return ThreadPoolExecutor(
+        max_workers=config.get("MAX_WORKERS"), thread_name_prefix="djpieuvre-hooks"
+    )
+
+
+@receiver(setting_changed)
+def reset_hook_executor(setting, **kwargs):
+    if setting == "DJPIEUVRE":
+        executor = get_hook_executor()
+        if executor is not None:
+            executor.shutdown(wait=False)
+        get_hook_executor.cache_clear()
+
+
+def _call_in_thread(func, args, evaluate):
+    try:
+        return evaluate(func(*args))
+    finally:
+        # Threads of the pool are not managed by Django, so they must not keep connections open
+        connections.close_all()
+
+
+def call_hooks(funcs, *args, evaluate=list):
+    """
+    Call the given task assignment hooks and return an iterable of their results, evaluated by
+    `evaluate` (querysets are evaluated there so that hooks actually run concurrently).
+    If the hook executor is enabled, all hooks are evaluated at once and HookTimeout is raised if
+    they do not complete in time. Otherwise, hooks are lazily evaluated one after the other.
+    """
+    executor = get_hook_executor()
+    if executor is None or len(funcs) < 2:
+        return (evaluate(func(*args)) for func in funcs)
+
+    futures = [executor.submit(_call_in_thread, func, args, evaluate) for func in funcs]
+    timeout = get_setting("HOOK_EXECUTOR").get("TIMEOUT")
+    _, not_done = wait(futures, timeout=timeout)
+    if not_done:
+        for future in not_done:
+            future.cancel()
+        raise HookTimeout(f"Task assignment hooks did not complete in {timeout}s")
+    return [future.result() for future in futures]
+
+
+async def _acall(func, args):
+    return await aget_pks(await acall_hook(func, *args))
+
+
+async def acall_hooks(funcs, *args):
+    """
+    Async version of `call_hooks`, yielding the primary keys returned by the hooks.
+    If the hook executor is enabled, hooks are awaited together with `asyncio.gather`.
+    """
+    config = get_setting("HOOK_EXECUTOR")
+    if not config or len(funcs) < 2:
+        for func in funcs:
+            yield await _acall(func, args)
+        return
+
+    timeout = config.get("TIMEOUT")
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*(_acall(func, args) for func in funcs)), timeout
+        )
+    except asyncio.TimeoutError:
+        raise HookTimeout(f"Task assignment hooks did not complete in {timeout}s")
+    for result in results:
+        yield result
@@ -0,0 +1,58 @@
+import contextlib
+from contextvars import ContextVar
+
+_identity_map = ContextVar("djpieuvre_identity_map", default=None)
+
+
+class WorkflowIdentityMap:
+    """
+    Workflow instances built during a unit of work (see `workflow_scope`).
+    Keys are (content type id, object id, workflow name) tuples, so that a workflow and its
+    process are only built once per target, whether they are reached from the target or
+    from its PieuvreProcess.
+    """
+
+    def __init__(self):
+        self._workflows = {}
+        # Authorization snapshots of the users, keyed by user pk (see `get_authorization_snapshot`)
+        self.authorizations = {}
+
+    def get(self, key):
+        return self._workflows.get(key)
+
+    def add(self, key, workflow):
+        self._workflows[key] = workflow
+
+    def clear(self):
+        self._workflows.clear()
+        self.authorizations.clear()
+
+    def __len__(self):
+        return len(self._workflows)
+
+
+def get_identity_map():
+    """
+    Return the identity map of the current workflow scope, or None outside of a scope.
+    """
+    return _identity_map.get()
+
+
+@contextlib.contextmanager
+def workflow_scope():
+    """
+    Reuse the workflow instances built within the block (by `Workflow.get_instance`,
+    `WorkflowEnabled.workflow_instances` or `PieuvreProcess.workflow`).
+    Nested scopes share the map of the outermost scope, which is discarded when it exits.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        yield identity_map
+        return
+
+    identity_map = WorkflowIdentityMap()
+    token = _identity_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _identity_map.reset(token)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from djpieuvre.constants import TASK_STATES
+from djpieuvre.models import PieuvreTask
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the representation of the targets stored on the tasks "
+        "(see the TASK_REPR_SNAPSHOT setting)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also refresh the tasks that are already processed",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of tasks whose targets are loaded at once",
+        )
+
+    def handle(self, *args, **options):
+        queryset = PieuvreTask.objects.all()
+        if not options["all"]:
+            queryset = queryset.filter(state=TASK_STATES.CREATED)
+
+        updated = PieuvreTask.refresh_repr_snapshots(
+            queryset, batch_size=options["batch_size"]
+        )
+        self.stdout.write(f"{updated} tasks refreshed")
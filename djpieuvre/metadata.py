@@ -0,0 +1,43 @@
+from types import MappingProxyType
+
+
+class WorkflowMetadata:
+    """
+    Immutable description of a workflow class, computed once when the workflow is registered,
+    so that serializers do not introspect the workflow class for every object.
+    """
+
+    __slots__ = ("name", "version", "fancy_name", "states", "transitions")
+
+    def __init__(self, workflow_class):
+        self.name = workflow_class.name
+        self.version = getattr(workflow_class, "version", 1)
+        self.fancy_name = workflow_class.fancy_name
+        self.states = self._get_states(workflow_class)
+        self.transitions = tuple(
+            MappingProxyType(dict(transition))
+            for transition in workflow_class.transitions
+        )
+
+    @staticmethod
+    def _get_states(workflow_class):
+        """
+        Return the display names of the states keyed by state if they are django extended choices,
+        the states themselves otherwise.
+        """
+        states = getattr(workflow_class, "states", None) or ()
+        if hasattr(states, "for_value") and isinstance(
+            getattr(states, "values", None), dict
+        ):
+            return MappingProxyType(
+                {key: states.for_value(key).display for key in states.values.keys()}
+            )
+        return tuple(states)
+
+    def get_states(self):
+        """
+        Return the states as they are serialized.
+        """
+        if isinstance(self.states, MappingProxyType):
+            return dict(self.states)
+        return list(self.states)
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_task_assignees(apps, schema_editor):
+    PieuvreTask = apps.get_model("djpieuvre", "PieuvreTask")
+    PieuvreTaskAssignee = apps.get_model("djpieuvre", "PieuvreTaskAssignee")
+
+    principals = {pk: set() for pk in PieuvreTask.objects.values_list("pk", flat=True)}
+    for task_id, user_id in PieuvreTask.users.through.objects.values_list(
+        "pieuvretask_id", PieuvreTask._meta.get_field("users").m2m_reverse_name()
+    ):
+        principals[task_id].add(("user", user_id))
+    for task_id, group_id in PieuvreTask.groups.through.objects.values_list(
+        "pieuvretask_id", "group_id"
+    ):
+        principals[task_id].add(("group", group_id))
+
+    open_tasks = set(
+        PieuvreTask.objects.filter(state="created").values_list("pk", flat=True)
+    )
+    PieuvreTaskAssignee.objects.bulk_create(
+        [
+            PieuvreTaskAssignee(
+                task_id=task_id,
+                principal_type=principal_type,
+                principal_id=principal_id,
+                is_open=task_id in open_tasks,
+            )
+            for task_id, task_principals in principals.items()
+            for principal_type, principal_id in task_principals or {("everyone", 0)}
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0001_initial_squashed_0007_alter_pieuvreprocess_workflow_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PieuvreTaskAssignee",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "principal_type",
+                    models.CharField(
+                        choices=[
+                            ("user", "User"),
+                            ("group", "Group"),
+                            ("everyone", "Everyone"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("principal_id", models.PositiveBigIntegerField()),
+                ("is_open", models.BooleanField(default=True)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="assignees",
+                        to="djpieuvre.pieuvretask",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["principal_type", "principal_id", "is_open", "task"],
+                        name="djpieuvre_assignee_idx",
+                    )
+                ],
+                "unique_together": {("task", "principal_type", "principal_id")},
+            },
+        ),
+        migrations.RunPython(fill_task_assignees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0008_pieuvretaskassignee"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="djpieuvre_task_created_idx"
+            ),
+        ),
+    ]
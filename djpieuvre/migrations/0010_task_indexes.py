@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0009_pieuvretask_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pieuvreprocess",
+            index=models.Index(
+                fields=["workflow_name", "state"], name="djpieuvre_process_state_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                fields=["process", "task", "state"], name="djpieuvre_task_process_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                fields=["state", "created_at"], name="djpieuvre_task_state_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                condition=models.Q(("state", "created")),
+                fields=["-created_at", "-id"],
+                name="djpieuvre_task_open_idx",
+            ),
+        ),
+    ]
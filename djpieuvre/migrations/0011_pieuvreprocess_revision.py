@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0010_task_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pieuvreprocess",
+            name="revision",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:11
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def close_duplicated_open_tasks(apps, schema_editor):
+    """
+    Only keep the oldest open task of each process and state, so that the constraint can be created.
+    """
+    PieuvreTask = apps.get_model("djpieuvre", "PieuvreTask")
+    PieuvreTaskAssignee = apps.get_model("djpieuvre", "PieuvreTaskAssignee")
+
+    open_tasks = PieuvreTask.objects.filter(state="created")
+    kept = (
+        open_tasks.values("process", "task")
+        .order_by()
+        .annotate(kept_id=Min("pk"))
+        .values_list("kept_id", flat=True)
+    )
+    duplicates = open_tasks.exclude(pk__in=list(kept))
+    PieuvreTaskAssignee.objects.filter(task__in=duplicates).update(is_open=False)
+    duplicates.update(state="done")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0011_pieuvreprocess_revision"),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicated_open_tasks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="pieuvretask",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("state", "created")),
+                fields=("process", "task"),
+                name="djpieuvre_unique_open_task",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0012_unique_open_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pieuvretask",
+            name="repr_snapshot",
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
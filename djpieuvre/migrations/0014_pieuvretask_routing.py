@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("djpieuvre", "0013_pieuvretask_repr_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pieuvretask",
+            name="content_type",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="contenttypes.contenttype",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pieuvretask",
+            name="object_id",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="pieuvretask",
+            name="workflow_name",
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def copy_routing(apps, schema_editor):
+    PieuvreProcess = apps.get_model("djpieuvre", "PieuvreProcess")
+    PieuvreTask = apps.get_model("djpieuvre", "PieuvreTask")
+
+    process = PieuvreProcess.objects.filter(pk=OuterRef("process_id"))
+    PieuvreTask.objects.update(
+        content_type_id=Subquery(process.values("content_type_id")[:1]),
+        object_id=Subquery(process.values("object_id")[:1]),
+        workflow_name=Subquery(process.values("workflow_name")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    # Data is copied in its own migration: PostgreSQL cannot create the indexes of the copied
+    # fields in the transaction that updated them.
+
+    dependencies = [
+        ("djpieuvre", "0014_pieuvretask_routing"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_routing, migrations.RunPython.noop),
+    ]
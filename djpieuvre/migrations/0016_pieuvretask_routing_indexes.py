@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("djpieuvre", "0015_copy_task_routing"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                fields=["workflow_name", "state"], name="djpieuvre_task_workflow_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pieuvretask",
+            index=models.Index(
+                fields=["content_type", "object_id", "state"],
+                name="djpieuvre_task_target_idx",
+            ),
+        ),
+    ]
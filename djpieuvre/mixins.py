@@ -1,3 +1,10 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.fields import GenericRelation
+from django.db import models
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
 from pieuvre import WorkflowEnabled as PieuvreWorkflowEnabled
 
 
@@ -6,6 +13,11 @@ class WorkflowEnabled(PieuvreWorkflowEnabled):
     This superclass adds a `workflows` property on the inheriting model
     """
 
+    # Name of the generic relation to PieuvreProcess installed on the inheriting model.
+    # Like any generic relation, it deletes the processes (and their tasks) of an object
+    # when the object is deleted. Set to None to prevent the relation from being installed.
+    workflow_processes_relation = "processes"
+
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         cls._workflows = []
@@ -17,7 +29,13 @@ class WorkflowEnabled(PieuvreWorkflowEnabled):
 
     @property
     def workflow_instances(self):
-        return [w(self) for w in self.workflows]
+        return [w.get_instance(self) for w in self.workflows]
+
+    async def aworkflow_instances(self):
+        """
+        Async version of `workflow_instances`: processes are read or created with the async ORM.
+        """
+        return [await w.aget_instance(self) for w in self.workflows]
 
     @classmethod
     def register_workflow(cls, workflow_class):
@@ -31,6 +49,50 @@ class WorkflowEnabled(PieuvreWorkflowEnabled):
         return None
 
 
+@receiver(class_prepared)
+def install_workflow_processes_relation(sender, **kwargs):
+    """
+    Install a generic relation to PieuvreProcess on every model inheriting from WorkflowEnabled,
+    so that the processes of a list of objects can be prefetched.
+    Deleting an object then deletes its processes and their tasks.
+    """
+    if not issubclass(sender, WorkflowEnabled):
+        return
+
+    relation = sender.workflow_processes_relation
+    if not relation or hasattr(sender, relation):
+        # Either disabled, or already defined by the model (or one of its parents)
+        return
+
+    sender.add_to_class(relation, GenericRelation("djpieuvre.PieuvreProcess"))
+
+
+class WorkflowEnabledQuerySet(models.QuerySet):
+    def with_workflow_processes(self):
+        """
+        Prefetch the PieuvreProcess instances of the objects, so that instantiating
+        their workflows does not require one query per workflow and per object.
+        """
+        return self.prefetch_related(self.model.workflow_processes_relation)
+
+
+WorkflowEnabledManager = models.Manager.from_queryset(WorkflowEnabledQuerySet)
+
+
+def prefetch_workflow_processes(objs):
+    """
+    Prefetch the PieuvreProcess instances of a list of objects of any WorkflowEnabled models,
+    with one query per model. Objects whose processes were already prefetched are skipped.
+    """
+    objs_by_model = defaultdict(list)
+    for obj in objs:
+        if getattr(obj, "workflow_processes_relation", None):
+            objs_by_model[type(obj)].append(obj)
+
+    for model_objs in objs_by_model.values():
+        prefetch_related_objects(model_objs, model_objs[0].workflow_processes_relation)
+
+
 class RequestInfoMixin:
     """
     Provides simple interface to gather request information within Serializer.
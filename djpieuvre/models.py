@@ -1,16 +1,29 @@
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connections, models, router
+from django.db.models import prefetch_related_objects
 
-from djpieuvre.constants import TASK_STATES
+from djpieuvre.constants import TASK_PRINCIPAL_TYPES, TASK_STATES
+from djpieuvre.counters import invalidate_task_counts
+from djpieuvre.exceptions import StaleProcess
+from djpieuvre.identity import workflow_scope
 from djpieuvre.mixins import WorkflowEnabled
+from djpieuvre.utils import (
+    aget_content_type,
+    aget_pks,
+    batched,
+    get_pks,
+    get_repr_snapshot,
+)
 
 from pieuvre.exceptions import TransitionDoesNotExist
 
 
 class PieuvreProcess(WorkflowEnabled, models.Model):
     STATE_FIELD_NAME = "state"
+    # A process does not have processes on its own
+    workflow_processes_relation = None
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
@@ -20,6 +33,8 @@ class PieuvreProcess(WorkflowEnabled, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     edited_at = models.DateTimeField(auto_now=True)
     state = models.TextField()
+    # Incremented by every update of the process, so that concurrent updates can be detected
+    revision = models.PositiveIntegerField(default=0)
 
     data = models.JSONField(null=True, blank=True)
 
@@ -31,9 +46,44 @@ class PieuvreProcess(WorkflowEnabled, models.Model):
             raise ValueError(f"Workflow {self.workflow_name} is not registered")
         return workflow
 
+    @property
+    def workflow(self):
+        """
+        Return the workflow of the process, shared with the rest of the current workflow scope
+        (see `djpieuvre.identity.workflow_scope`).
+        """
+        if self._workflow is None:
+            self._workflow = self.get_workflow_class().get_instance(self)
+        return self._workflow
+
+    @workflow.setter
+    def workflow(self, value):
+        self._workflow = value
+
+    async def aget_workflow(self):
+        """
+        Async version of the `workflow` property.
+        """
+        if self._workflow is None:
+            self._workflow = await self.get_workflow_class().aget_instance(self)
+        return self._workflow
+
+    async def aget_process_target(self):
+        """
+        Async version of the `process_target` accessor.
+        """
+        if not self._meta.get_field("process_target").is_cached(self):
+            content_type = await aget_content_type(pk=self.content_type_id)
+            self.process_target = await content_type.model_class()._base_manager.aget(
+                pk=self.object_id
+            )
+        return self.process_target
+
     @property
     def workflow_fancy_name(self):
-        return self.get_workflow_class().fancy_name
+        from djpieuvre.core import get_metadata
+
+        return get_metadata(self.workflow_name, self.workflow_version).fancy_name
 
     def __str__(self):
         return (
@@ -43,6 +93,11 @@ class PieuvreProcess(WorkflowEnabled, models.Model):
     class Meta:
         unique_together = ("content_type", "object_id", "workflow_name")
         ordering = ("created_at",)
+        indexes = [
+            models.Index(
+                fields=["workflow_name", "state"], name="djpieuvre_process_state_idx"
+            )
+        ]
 
 
 class PieuvreTask(models.Model):
@@ -60,33 +115,489 @@ class PieuvreTask(models.Model):
     groups = models.ManyToManyField("auth.Group")
 
     data = models.JSONField(null=True, blank=True)
+    # Representation of the target when the task was created (see the `TASK_REPR_SNAPSHOT` setting)
+    repr_snapshot = models.TextField(null=True, blank=True)
+    # Copied from the process (see `get_routing`), so that tasks can be listed and filtered
+    # by workflow or target without joining the processes
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, null=True, related_name="+"
+    )
+    object_id = models.PositiveIntegerField(null=True)
+    workflow_name = models.CharField(max_length=255, null=True)
+
+    @property
+    def is_open(self):
+        return self.state == TASK_STATES.CREATED
+
+    @property
+    def target_model_name(self):
+        # Content types are cached, so this does not query the database.
+        # Tasks created before their routing fields were filled only have it on their process.
+        content_type_id = self.content_type_id or self.process.content_type_id
+        return ContentType.objects.get_for_id(content_type_id).model
+
+    @staticmethod
+    def get_routing(process):
+        """
+        Return the fields of the process copied on its tasks.
+        """
+        return {
+            "content_type_id": process.content_type_id,
+            "object_id": process.object_id,
+            "workflow_name": process.workflow_name,
+        }
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if self.workflow_name is None and self.process_id:
+            for field, value in self.get_routing(self.process).items():
+                setattr(self, field, value)
+        super().save(*args, **kwargs)
+        if adding:
+            # Until it is assigned, the task can be accessed by everyone (see `get_task_predicate`)
+            PieuvreTaskAssignee.objects.bulk_create(
+                self._get_assignees({PieuvreTaskAssignee.EVERYONE}),
+                ignore_conflicts=True,
+            )
 
     def assign(self, transition, users, groups):
         """
         Takes a pieuvre transition and tries to assign it to some users.
         Override to implement custom behavior.
         """
-        if users:
-            self.users.set(users)
-        if groups:
-            self.groups.set(groups)
+        # Users and groups are only handled through their primary keys
+        user_ids = get_pks(users) if users is not None else None
+        group_ids = get_pks(groups) if groups is not None else None
+
+        # The assignees are synchronized once both users and groups are set
+        self._defer_assignees_sync = True
+        try:
+            if user_ids:
+                self.users.set(user_ids)
+            if group_ids:
+                self.groups.set(group_ids)
+        finally:
+            self._defer_assignees_sync = False
+        # Users or groups that were not set are read from the database
+        self.sync_assignees(user_ids or None, group_ids or None)
+
+    async def aassign(self, transition, users, groups):
+        """
+        Async version of `assign`.
+        """
+        user_ids = await aget_pks(users) if users is not None else None
+        group_ids = await aget_pks(groups) if groups is not None else None
+
+        self._defer_assignees_sync = True
+        try:
+            if user_ids:
+                await self.users.aset(user_ids)
+            if group_ids:
+                await self.groups.aset(group_ids)
+        finally:
+            self._defer_assignees_sync = False
+        await self.async_assignees(user_ids or None, group_ids or None)
+
+    def sync_assignees(self, user_ids=None, group_ids=None):
+        """
+        Update the assignee index of the task (see `PieuvreTaskAssignee`) from its users and groups.
+        The primary keys of the users and groups can be given if they are known, otherwise
+        they are read from the database.
+        """
+        if user_ids is None:
+            user_ids = self.users.values_list("pk", flat=True)
+        if group_ids is None:
+            group_ids = self.groups.values_list("pk", flat=True)
+        principals = self._get_principals(user_ids, group_ids)
+
+        existing = set(self.assignees.values_list("principal_type", "principal_id"))
+        stale = existing - principals
+        if stale:
+            self.assignees.filter(self._get_principals_filter(stale)).delete()
+
+        PieuvreTaskAssignee.objects.bulk_create(
+            self._get_assignees(principals - existing), ignore_conflicts=True
+        )
+        invalidate_task_counts()
+
+    async def async_assignees(self, user_ids=None, group_ids=None):
+        """
+        Async version of `sync_assignees`.
+        """
+        if user_ids is None:
+            user_ids = await aget_pks(self.users.all())
+        if group_ids is None:
+            group_ids = await aget_pks(self.groups.all())
+        principals = self._get_principals(user_ids, group_ids)
+
+        existing = {
+            principal
+            async for principal in self.assignees.values_list(
+                "principal_type", "principal_id"
+            )
+        }
+        stale = existing - principals
+        if stale:
+            await self.assignees.filter(self._get_principals_filter(stale)).adelete()
+
+        await PieuvreTaskAssignee.objects.abulk_create(
+            self._get_assignees(principals - existing), ignore_conflicts=True
+        )
+        invalidate_task_counts()
+
+    @staticmethod
+    def _get_principals(user_ids, group_ids):
+        principals = {(TASK_PRINCIPAL_TYPES.USER, pk) for pk in user_ids} | {
+            (TASK_PRINCIPAL_TYPES.GROUP, pk) for pk in group_ids
+        }
+        return principals or {PieuvreTaskAssignee.EVERYONE}
+
+    @staticmethod
+    def _get_principals_filter(principals):
+        f = models.Q()
+        for principal_type, principal_id in principals:
+            f |= models.Q(principal_type=principal_type, principal_id=principal_id)
+        return f
+
+    def _get_assignees(self, principals):
+        return [
+            PieuvreTaskAssignee(
+                task=self,
+                principal_type=principal_type,
+                principal_id=principal_id,
+                is_open=self.is_open,
+            )
+            for principal_type, principal_id in principals
+        ]
+
+    @classmethod
+    def refresh_repr_snapshot(cls, target):
+        """
+        Update the representation stored on the tasks of the target, when it has changed.
+        Return the number of updated tasks.
+        """
+        return cls.objects.filter(
+            content_type=ContentType.objects.get_for_model(target),
+            object_id=target.pk,
+        ).update(repr_snapshot=get_repr_snapshot(target))
+
+    @classmethod
+    def refresh_repr_snapshots(cls, queryset=None, batch_size=1000):
+        """
+        Update the representation stored on the given tasks (all tasks by default), loading
+        their targets in batches. Return the number of updated tasks.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        updated = 0
+        for tasks in batched(
+            queryset.select_related("process").order_by("pk"), batch_size
+        ):
+            prefetch_related_objects(tasks, "process__process_target")
+            for task in tasks:
+                task.repr_snapshot = get_repr_snapshot(task.process.process_target)
+            updated += cls.objects.bulk_update(tasks, ["repr_snapshot"])
+        return updated
+
+    @classmethod
+    def get_or_create_open(cls, process, task, name, repr_snapshot=None):
+        """
+        Return the open task of the process for the given state as a tuple (task, created),
+        creating it if it does not exist yet.
+        The task is only created if the process is still in the state it was read in
+        (`process.state`): StaleProcess is raised otherwise.
+
+        On backends supporting it, this is a single `INSERT ... ON CONFLICT DO NOTHING RETURNING`
+        query relying on the unique constraint on open tasks. Other backends (such as MySQL)
+        do not support that constraint, so the process is claimed by incrementing its
+        revision before creating the task.
+        """
+        db = router.db_for_write(cls)
+        connection = connections[db]
+        obj = cls(
+            process=process,
+            task=task,
+            name=name,
+            state=TASK_STATES.CREATED,
+            repr_snapshot=repr_snapshot,
+            **cls.get_routing(process),
+        )
+
+        if (
+            connection.vendor in ("postgresql", "sqlite")
+            and connection.features.can_return_columns_from_insert
+        ):
+            if cls._insert_open(obj, connection):
+                return obj, True
+        else:
+            claimed = PieuvreProcess.objects.filter(
+                pk=process.pk, state=process.state, revision=process.revision
+            ).update(revision=models.F("revision") + 1)
+            if claimed:
+                process.revision += 1
+                return cls.objects.get_or_create(
+                    process=process,
+                    task=task,
+                    state=TASK_STATES.CREATED,
+                    defaults={
+                        "name": name,
+                        "repr_snapshot": repr_snapshot,
+                        **cls.get_routing(process),
+                    },
+                )
+
+        existing = cls.objects.filter(
+            process=process,
+            task=task,
+            state=TASK_STATES.CREATED,
+            process__state=process.state,
+        ).first()
+        if existing is None:
+            raise StaleProcess(f"Process {process.pk} left the {process.state} state")
+        return existing, False
+
+    @classmethod
+    async def aget_or_create_open(cls, process, task, name, repr_snapshot=None):
+        """
+        Async version of `get_or_create_open`.
+        Raw queries have no async API, so the process is always claimed by incrementing
+        its revision.
+        """
+        claimed = await PieuvreProcess.objects.filter(
+            pk=process.pk, state=process.state, revision=process.revision
+        ).aupdate(revision=models.F("revision") + 1)
+        if claimed:
+            process.revision += 1
+            return await cls.objects.aget_or_create(
+                process=process,
+                task=task,
+                state=TASK_STATES.CREATED,
+                defaults={
+                    "name": name,
+                    "repr_snapshot": repr_snapshot,
+                    **cls.get_routing(process),
+                },
+            )
+
+        existing = await cls.objects.filter(
+            process=process,
+            task=task,
+            state=TASK_STATES.CREATED,
+            process__state=process.state,
+        ).afirst()
+        if existing is None:
+            raise StaleProcess(f"Process {process.pk} left the {process.state} state")
+        return existing, False
+
+    @classmethod
+    def _insert_open(cls, obj, connection):
+        """
+        Insert the open task if the process is still in the same state and the task does
+        not exist yet. Return True if the task was inserted.
+        """
+        qn = connection.ops.quote_name
+        fields = [
+            f for f in cls._meta.concrete_fields if not isinstance(f, models.AutoField)
+        ]
+        columns = ", ".join(qn(f.column) for f in fields)
+        if connection.vendor == "postgresql":
+            # Values of a SELECT list are not typed after the columns they are inserted into
+            placeholders = ", ".join(
+                f"%s::{f.cast_db_type(connection)}" for f in fields
+            )
+        else:
+            placeholders = ", ".join(["%s"] * len(fields))
+        params = [f.get_db_prep_save(f.pre_save(obj, True), connection) for f in fields]
+        process_table = qn(PieuvreProcess._meta.db_table)
+        sql = (
+            f"INSERT INTO {qn(cls._meta.db_table)} ({columns}) "
+            f"SELECT {placeholders} WHERE EXISTS ("
+            f"SELECT 1 FROM {process_table} WHERE {qn('id')} = %s AND {qn('state')} = %s"
+            f") ON CONFLICT DO NOTHING RETURNING {qn(cls._meta.pk.column)}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, obj.process.pk, obj.process.state])
+            row = cursor.fetchone()
+
+        if row is None:
+            return False
+
+        obj.pk = row[0]
+        obj._state.adding = False
+        obj._state.db = connection.alias
+        return True
+
+    @classmethod
+    def bulk_create_and_assign(cls, assignments):
+        """
+        Create tasks in bulk and assign them.
+        `assignments` is a list of (task, users, groups) tuples, where tasks are not saved yet.
+        Unlike `assign`, users and groups are set with a single query each.
+        """
+        tasks = [task for task, _, _ in assignments]
+        cls.objects.bulk_create(tasks)
+
+        if any(task.pk is None for task in tasks):
+            # Some backends do not return the primary keys of bulk created objects
+            pks = dict(
+                cls.objects.filter(
+                    process__in=[task.process_id for task in tasks],
+                    state=TASK_STATES.CREATED,
+                ).values_list("process_id", "pk")
+            )
+            for task in tasks:
+                task.pk = pks[task.process_id]
+
+        principals = {task.pk: set() for task in tasks}
+        for field_name, index, principal_type in (
+            ("users", 1, TASK_PRINCIPAL_TYPES.USER),
+            ("groups", 2, TASK_PRINCIPAL_TYPES.GROUP),
+        ):
+            field = cls._meta.get_field(field_name)
+            source = f"{field.m2m_field_name()}_id"
+            target = f"{field.m2m_reverse_field_name()}_id"
+            rows = []
+            for assignment in assignments:
+                task = assignment[0]
+                for obj in assignment[index]:
+                    pk = getattr(obj, "pk", obj)
+                    rows.append(
+                        field.remote_field.through(**{source: task.pk, target: pk})
+                    )
+                    principals[task.pk].add((principal_type, pk))
+            field.remote_field.through.objects.bulk_create(rows, ignore_conflicts=True)
+
+        PieuvreTaskAssignee.objects.bulk_create(
+            [
+                PieuvreTaskAssignee(
+                    task_id=task_pk,
+                    principal_type=principal_type,
+                    principal_id=principal_id,
+                )
+                for task_pk, task_principals in principals.items()
+                for principal_type, principal_id in (
+                    task_principals or {PieuvreTaskAssignee.EVERYONE}
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        invalidate_task_counts()
+
+        return tasks
 
     def complete(self, transition_name):
-        # Make sure the transition is allowed
-        transition = self.process.workflow.get_available_transition(transition_name)
+        with workflow_scope():
+            workflow = self.process.workflow
+            # Make sure the transition is allowed
+            transition = workflow.get_available_transition(transition_name)
+
+            if not transition:
+                raise TransitionDoesNotExist(transition=transition_name)
+
+            self.state = TASK_STATES.DONE
+            workflow.run_transition(transition_name, self)
+            self.assignees.update(is_open=False)
+
+            # This lets us prevent the automatic transition from happening, useful in certain cases
+            if transition.get("auto_advance", True):
+                workflow.advance_workflow()
+
+        invalidate_task_counts()
+
+    async def acomplete(self, transition_name):
+        """
+        Async version of `complete` (see `Workflow.aadvance_workflow`).
+        """
+        with workflow_scope():
+            if not PieuvreTask.process.is_cached(self):
+                self.process = await PieuvreProcess.objects.aget(pk=self.process_id)
+            workflow = await self.process.aget_workflow()
+            transition = workflow.get_available_transition(transition_name)
+
+            if not transition:
+                raise TransitionDoesNotExist(transition=transition_name)
 
-        if not transition:
-            raise TransitionDoesNotExist(transition=transition_name)
+            self.state = TASK_STATES.DONE
+            await workflow.arun_transition(transition_name, self)
+            await self.assignees.aupdate(is_open=False)
 
-        self.state = TASK_STATES.DONE
-        self.process.workflow.run_transition(transition_name, self)
+            if transition.get("auto_advance", True):
+                await workflow.aadvance_workflow()
 
-        # This lets us prevent the automatic transition from happening, useful in certain cases
-        if transition.get("auto_advance", True):
-            self.process.workflow.advance_workflow()
+        invalidate_task_counts()
 
     def __str__(self):
-        return f"Task {self.name} {self.process.content_type.model} ({self.process.object_id})"
+        return f"Task {self.name} {self.target_model_name} ({self.object_id})"
 
     class Meta:
         ordering = ("-created_at",)
+        constraints = [
+            # A process has a single open task per state.
+            # Ignored by backends without partial indexes support.
+            models.UniqueConstraint(
+                fields=["process", "task"],
+                condition=models.Q(state=TASK_STATES.CREATED),
+                name="djpieuvre_unique_open_task",
+            )
+        ]
+        indexes = [
+            # Used by the task list cursor pagination
+            models.Index(
+                fields=["-created_at", "-id"], name="djpieuvre_task_created_idx"
+            ),
+            # Used to find the open task of a process when advancing its workflow
+            models.Index(
+                fields=["process", "task", "state"], name="djpieuvre_task_process_idx"
+            ),
+            models.Index(
+                fields=["state", "created_at"], name="djpieuvre_task_state_idx"
+            ),
+            # Used to filter the tasks by workflow or by target
+            models.Index(
+                fields=["workflow_name", "state"], name="djpieuvre_task_workflow_idx"
+            ),
+            models.Index(
+                fields=["content_type", "object_id", "state"],
+                name="djpieuvre_task_target_idx",
+            ),
+            # Used by the inbox. Ignored by backends without partial indexes support
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(state=TASK_STATES.CREATED),
+                name="djpieuvre_task_open_idx",
+            ),
+        ]
+
+
+class PieuvreTaskAssignee(models.Model):
+    """
+    Denormalized index of the principals (users, groups, or everyone) a task is assigned to,
+    so that the tasks of a user can be fetched with a single indexed lookup.
+    It is maintained when tasks are created, by `PieuvreTask.assign`, `PieuvreTask.complete`
+    and changes to the task users and groups.
+    """
+
+    # Principal of the tasks that are neither assigned to a user nor to a group
+    EVERYONE = (TASK_PRINCIPAL_TYPES.EVERYONE, 0)
+
+    task = models.ForeignKey(
+        PieuvreTask, on_delete=models.CASCADE, related_name="assignees"
+    )
+    principal_type = models.CharField(choices=TASK_PRINCIPAL_TYPES, max_length=16)
+    principal_id = models.PositiveBigIntegerField()
+    is_open = models.BooleanField(default=True)
+
+    def __str__(self):
+        return (
+            f"Task {self.task_id} assigned to {self.principal_type} {self.principal_id}"
+        )
+
+    class Meta:
+        unique_together = ("task", "principal_type", "principal_id")
+        indexes = [
+            models.Index(
+                fields=["principal_type", "principal_id", "is_open", "task"],
+                name="djpieuvre_assignee_idx",
+            )
+        ]
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+from djpieuvre.conf import get_setting
+
+
+class TaskCursorPagination(CursorPagination):
+    """
+    Keyset pagination of the tasks, most recent first.
+    Unlike offset pagination, fetching a page does not get slower as the client goes further,
+    since it relies on the (created_at, id) index of PieuvreTask.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def __init__(self):
+        self.page_size = get_setting("TASK_PAGE_SIZE")
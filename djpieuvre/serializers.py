@@ -1,13 +1,21 @@
+from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
+from django.db.models import Manager
 from drf_spectacular.utils import extend_schema_field
-from extended_choices import Choices
 from rest_framework import serializers
 
 from djpieuvre import constants
+from djpieuvre.authorization import get_authorization_snapshot
+from djpieuvre.conf import get_setting
 from djpieuvre.constants import TASK_STATES
-from djpieuvre.exceptions import WorkflowDoesNotExist
+from djpieuvre.exceptions import ProcessConflict, StaleProcess, WorkflowDoesNotExist
+from djpieuvre.identity import workflow_scope
 from djpieuvre.models import PieuvreTask, PieuvreProcess
-from djpieuvre.mixins import RequestInfoMixin, WorkflowEnabled
+from djpieuvre.mixins import (
+    RequestInfoMixin,
+    WorkflowEnabled,
+    prefetch_workflow_processes,
+)
 from pieuvre.exceptions import (
     TransitionDoesNotExist,
     InvalidTransition,
@@ -16,9 +24,39 @@ from pieuvre.exceptions import (
 )
 
 
+def check_expected_process(process, data):
+    """
+    Raise ProcessConflict if the process does not have the state or the revision
+    the client expects, i.e. the client worked on a stale version of the process.
+    """
+    expected_state = data.get("expected_state")
+    expected_revision = data.get("expected_revision")
+    if (expected_state is not None and process.state != expected_state) or (
+        expected_revision is not None and process.revision != expected_revision
+    ):
+        raise ProcessConflict()
+
+
+class ExpectedProcessMixin(serializers.Serializer):
+    expected_state = serializers.CharField(
+        write_only=True,
+        required=False,
+        help_text="Optional: the state the process is expected to be in. "
+        "If the process is in another state, a 409 error is returned.",
+    )
+    expected_revision = serializers.IntegerField(
+        write_only=True,
+        required=False,
+        help_text="Optional: the revision the process is expected to have. "
+        "If the process was modified since, a 409 error is returned.",
+    )
+
+
 class WorkflowSerializer(serializers.Serializer):
     # we expose the model pk as the workflow pk
     pk = serializers.CharField(source="model.pk")
+    # Only persisted workflows have a revision
+    revision = serializers.IntegerField(source="model.revision", required=False)
     fancy_name = serializers.CharField()
     name = serializers.CharField()
     state = serializers.CharField()
@@ -26,16 +64,13 @@ class WorkflowSerializer(serializers.Serializer):
     states = serializers.SerializerMethodField()
 
     def get_transitions(self, workflow):
-        return workflow.get_authorized_transitions(user=self.context.get("user", None))
+        return workflow.get_authorized_transitions(
+            user=self.context.get("user", None),
+            snapshot=self.context.get("authorization", None),
+        )
 
     def get_states(self, workflow):
-        if not isinstance(workflow.states, Choices):
-            return workflow.states
-
-        return {
-            key: workflow.states.for_value(key).display
-            for key in workflow.states.values.keys()
-        }
+        return workflow.get_metadata().get_states()
 
 
 class WorkflowStateSerializer(serializers.Serializer):
@@ -46,15 +81,48 @@ class WorkflowStateSerializer(serializers.Serializer):
     state = serializers.CharField()
 
 
+class InstanceWorkflowListSerializer(serializers.ListSerializer):
+    """
+    Serialize the workflows of many objects at once: their processes are fetched with one query
+    per model, and the user authorizations are resolved once for the whole list.
+    Set it as the `list_serializer_class` of the serializer Meta to use it.
+    """
+
+    def to_representation(self, data):
+        objs = list(data.all() if isinstance(data, Manager) else data)
+        prefetch_workflow_processes(objs)
+        with workflow_scope():
+            return super().to_representation(objs)
+
+
 class InstanceWorkflowSerializer(serializers.Serializer, RequestInfoMixin):
     """
-    This is a model serializer but since the target model is not known, we make it a generic serializer.
+    This is a model serializer but since the target model is not known, we make it a generic
+    serializer.
     Target model must inherit from WorkflowEnabled mixin.
     """
 
     workflows = serializers.SerializerMethodField()
     workflow_states = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = InstanceWorkflowListSerializer
+
+    @property
+    def authorization(self):
+        """
+        Return the authorizations of the user, shared by all the objects serialized together.
+        """
+        context = self.context
+        if "authorization" not in context:
+            context["authorization"] = get_authorization_snapshot(self.user)
+        return context["authorization"]
+
+    def to_representation(self, instance):
+        # Workflows are listed twice (`workflows` and `workflow_states`): only build them once
+        with workflow_scope():
+            return super().to_representation(instance)
+
     def get_workflow_serializer_class(self):
         return WorkflowSerializer
 
@@ -66,7 +134,11 @@ class InstanceWorkflowSerializer(serializers.Serializer, RequestInfoMixin):
         return [
             w
             for w in obj.workflow_instances
-            if w.is_allowed(self.user, perm=constants.WORKFLOW_PERM_SUFFIX_READ)
+            if w.is_allowed(
+                self.user,
+                perm=constants.WORKFLOW_PERM_SUFFIX_READ,
+                snapshot=self.authorization,
+            )
         ]
 
     @extend_schema_field(serializers.ListSerializer(child=WorkflowSerializer()))
@@ -75,7 +147,7 @@ class InstanceWorkflowSerializer(serializers.Serializer, RequestInfoMixin):
             self._get_workflows(obj),
             many=True,
             read_only=True,
-            context={"user": self.user},
+            context={"user": self.user, "authorization": self.authorization},
         ).data
 
     @extend_schema_field(serializers.ListSerializer(child=WorkflowStateSerializer()))
@@ -87,14 +159,16 @@ class InstanceWorkflowSerializer(serializers.Serializer, RequestInfoMixin):
 
 class PieuvreTaskListSerializer(serializers.ModelSerializer):
     process_id = serializers.CharField()
-    model = serializers.CharField(source="process.content_type.model")
-    model_id = serializers.CharField(source="process.object_id")
-    process_name = serializers.CharField(source="process.workflow_name")
+    model = serializers.CharField(source="target_model_name")
+    model_id = serializers.CharField(source="object_id")
+    process_name = serializers.CharField(source="workflow_name")
     process_fancy_name = serializers.CharField(source="process.workflow_fancy_name")
     instance_repr = serializers.SerializerMethodField()
 
     @staticmethod
     def get_instance_repr(task):
+        if get_setting("TASK_REPR_SNAPSHOT"):
+            return task.repr_snapshot
         try:
             return task.process.process_target.task_repr()
         except AttributeError:
@@ -121,6 +195,10 @@ class PieuvreTaskListSerializer(serializers.ModelSerializer):
 
 class PieuvreTaskDetailSerializer(PieuvreTaskListSerializer):
     transitions = serializers.SerializerMethodField()
+    process_state = serializers.CharField(source="process.state", read_only=True)
+    process_revision = serializers.IntegerField(
+        source="process.revision", read_only=True
+    )
 
     def get_transitions(self, task):
         request = self.context.get("request", None)
@@ -131,10 +209,22 @@ class PieuvreTaskDetailSerializer(PieuvreTaskListSerializer):
         fields = [f for f in PieuvreTaskListSerializer.Meta.fields] + [
             "transitions",
             "data",
+            "process_state",
+            "process_revision",
         ]
 
 
-class PieuvreTaskCompleteSerializer(serializers.Serializer):
+class WorkflowTaskCountsSerializer(serializers.Serializer):
+    total = serializers.IntegerField()
+    states = serializers.DictField(child=serializers.IntegerField())
+
+
+class TaskCountsSerializer(serializers.Serializer):
+    total = serializers.IntegerField()
+    workflows = serializers.DictField(child=WorkflowTaskCountsSerializer())
+
+
+class PieuvreTaskCompleteSerializer(ExpectedProcessMixin, serializers.Serializer):
     reason = serializers.CharField(required=False, allow_blank=True)
     transition = serializers.CharField(
         write_only=True,
@@ -142,6 +232,11 @@ class PieuvreTaskCompleteSerializer(serializers.Serializer):
         help_text="The name of the transition to execute",
     )
 
+    def validate(self, data):
+        data = super().validate(data)
+        check_expected_process(self.instance.process, data)
+        return data
+
     def save(self, **kwargs):
         transition = self.validated_data["transition"]
 
@@ -164,11 +259,19 @@ class PieuvreTaskCompleteSerializer(serializers.Serializer):
                 TransitionAmbiguous,
             ) as we:
                 raise serializers.ValidationError(we.message)
+            except StaleProcess:
+                raise ProcessConflict()
 
 
-class AdvanceWorkflowSerializer(serializers.Serializer):
+class AdvanceWorkflowSerializer(ExpectedProcessMixin, serializers.Serializer):
     workflow = serializers.PrimaryKeyRelatedField(
-        queryset=PieuvreProcess.objects.all(), required=True
+        queryset=PieuvreProcess.objects.all(), required=False
+    )
+    workflow_name = serializers.CharField(
+        write_only=True,
+        required=False,
+        help_text="Alternatively, the name of the workflow to advance. "
+        "Required when its process is not persisted yet (and has no pk).",
     )
     transition = serializers.CharField(
         write_only=True,
@@ -178,27 +281,56 @@ class AdvanceWorkflowSerializer(serializers.Serializer):
 
     @staticmethod
     def _get_workflow(pieuvre_process: PieuvreProcess, obj: WorkflowEnabled):
-        # FIXME: improve this logic
-        target_workflows = list(
-            filter(
-                lambda w: pieuvre_process.pk == w.model.pk,
-                obj.workflow_instances,
-            )
-        )
+        # The process must belong to the object: its workflow is then built directly,
+        # without instantiating the other workflows of the object
+        if (
+            pieuvre_process.content_type_id,
+            pieuvre_process.object_id,
+        ) != (ContentType.objects.get_for_model(obj).pk, obj.pk):
+            raise WorkflowDoesNotExist("Workflow does not exist")
 
-        if not target_workflows or len(target_workflows) > 1:
-            # not normal, there are many instances of the same (workflow, pieuvre_process)
+        try:
+            workflow_class = pieuvre_process.get_workflow_class()
+        except ValueError:
+            raise WorkflowDoesNotExist("Workflow does not exist")
+
+        if workflow_class not in obj.workflows:
+            raise WorkflowDoesNotExist("Workflow does not exist")
+
+        # Avoid fetching the object again through the generic foreign key
+        pieuvre_process.process_target = obj
+        return workflow_class.get_instance(pieuvre_process)
+
+    @staticmethod
+    def _get_workflow_by_name(workflow_name: str, obj: WorkflowEnabled):
+        workflow_class = next(
+            (w for w in obj.workflows if w.name == workflow_name), None
+        )
+        if not workflow_class:
             raise WorkflowDoesNotExist("Workflow does not exist")
 
-        return target_workflows[0]
+        return workflow_class.get_instance(obj)
 
     def validate(self, data):
         data = super().validate(data)
         try:
-            data["workflow"] = self._get_workflow(data["workflow"], self.context["obj"])
+            if "workflow" in data:
+                data["workflow"] = self._get_workflow(
+                    data["workflow"], self.context["obj"]
+                )
+            elif "workflow_name" in data:
+                data["workflow"] = self._get_workflow_by_name(
+                    data.pop("workflow_name"), self.context["obj"]
+                )
+            else:
+                raise serializers.ValidationError(
+                    {"workflow": "This field is required."}
+                )
         except WorkflowDoesNotExist:
             raise serializers.ValidationError({"workflow": "Workflow does not exist"})
 
+        check_expected_process(data["workflow"].model, data)
+
         transition_name = data.get("transition")
         # Make sure the transition exists and can be executed by the current user
         transition = next(
@@ -212,8 +344,8 @@ class AdvanceWorkflowSerializer(serializers.Serializer):
             None,
         )
         if transition_name and (not transition or transition.get("create_task", True)):
-            # If create_task is True, the transition must be activated by completing the task, not by the
-            # advance workflow endpoint.
+            # If create_task is True, the transition must be activated by completing the task,
+            # not by the advance workflow endpoint.
             raise serializers.ValidationError(
                 {"transition": "Transition is not available"}
             )
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from djpieuvre.cache import clear_hook_cache
+from djpieuvre.constants import TASK_PRINCIPAL_TYPES
+from djpieuvre.models import PieuvreTask
+
+
+def invalidate_hook_cache(sender, **kwargs):
+    """
+    Assignment hooks usually return users and groups: invalidate their results when those change.
+    """
+    if kwargs.get("action", "post_").startswith("pre_"):
+        return
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and update_fields <= {"last_login"}:
+        # Users are saved on every login, which does not change the hooks results
+        return
+    clear_hook_cache()
+
+
+def sync_task_assignees(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep the assignee index up to date when the users or groups of a task change.
+    """
+    if not reverse:
+        # The task itself was changed
+        if action.startswith("post_") and not getattr(
+            instance, "_defer_assignees_sync", False
+        ):
+            instance.sync_assignees()
+        return
+
+    # A user or a group was changed: find the tasks it was added to or removed from
+    if action == "pre_clear":
+        field = "users" if sender is PieuvreTask.users.through else "groups"
+        instance._pieuvre_cleared_tasks = list(
+            PieuvreTask.objects.filter(**{field: instance})
+        )
+        return
+
+    if action == "post_clear":
+        tasks = getattr(instance, "_pieuvre_cleared_tasks", [])
+    elif action.startswith("post_"):
+        tasks = PieuvreTask.objects.filter(pk__in=pk_set)
+    else:
+        return
+
+    for task in tasks:
+        task.sync_assignees()
+
+
+def sync_deleted_principal_tasks(sender, instance, **kwargs):
+    """
+    Users and groups are removed from their tasks when they are deleted (without m2m signals):
+    update the assignee index of those tasks.
+    """
+    principal_type = (
+        TASK_PRINCIPAL_TYPES.GROUP if sender is Group else TASK_PRINCIPAL_TYPES.USER
+    )
+    for task in PieuvreTask.objects.filter(
+        assignees__principal_type=principal_type, assignees__principal_id=instance.pk
+    ):
+        task.sync_assignees()
+
+
+def connect_signals():
+    User = get_user_model()
+
+    for model in (Group, User):
+        post_save.connect(invalidate_hook_cache, sender=model)
+        post_delete.connect(invalidate_hook_cache, sender=model)
+
+    if hasattr(User, "groups"):
+        m2m_changed.connect(invalidate_hook_cache, sender=User.groups.through)
+
+    for through in (PieuvreTask.users.through, PieuvreTask.groups.through):
+        m2m_changed.connect(sync_task_assignees, sender=through)
+    for model in (Group, User):
+        post_delete.connect(sync_deleted_principal_tasks, sender=model)
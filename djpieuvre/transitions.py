@@ -0,0 +1,189 @@
+from types import MappingProxyType
+
+from pieuvre import Workflow as PieuvreWorkflow
+
+
+class TransitionIndex:
+    """
+    Immutable lookup tables of the transitions of a workflow class.
+    It is compiled once when the workflow is registered, so that transition lookups
+    do not need to scan the `transitions` list.
+    """
+
+    __slots__ = ("by_name", "by_source", "wildcard")
+
+    def __init__(self, workflow_class):
+        transitions = tuple(workflow_class.transitions)
+
+        by_name = {}
+        for transition in transitions:
+            # Like Pieuvre, the first transition wins if names are duplicated
+            by_name.setdefault(transition["name"], transition)
+
+        sources = set()
+        for transition in transitions:
+            source = transition["source"]
+            if source == workflow_class.wildcard_state:
+                continue
+            sources.update(source if isinstance(source, list) else [source])
+
+        self.by_name = MappingProxyType(by_name)
+        # Transitions are kept in their definition order, wildcard transitions included
+        self.by_source = MappingProxyType(
+            {
+                state: tuple(
+                    t
+                    for t in transitions
+                    if workflow_class._check_state(t["source"], state)
+                )
+                for state in sources
+            }
+        )
+        # Transitions available from states that are not the source of any other transition
+        self.wildcard = tuple(
+            t for t in transitions if t["source"] == workflow_class.wildcard_state
+        )
+
+    def for_source(self, state):
+        """
+        Return the transitions that can be run from the given state.
+        """
+        return self.by_source.get(state, self.wildcard)
+
+    def get(self, name):
+        """
+        Return the transition with the given name, or None if it does not exist.
+        """
+        return self.by_name.get(name)
+
+
+class WorkflowGraph:
+    """
+    Static analysis of the graph of a workflow class, run once when the workflow is registered.
+
+    Only transitions without conditions (`check_<transition>` methods or state checks) can be
+    analyzed, since the others depend on the process at runtime.
+    Errors found in the graph are reported by the system checks (see `djpieuvre.checks`).
+    """
+
+    __slots__ = ("states", "unreachable_states", "automatic_paths", "errors")
+
+    def __init__(self, workflow_class, index):
+        conditional, exit_checks = self._get_conditions(workflow_class, index)
+        self.states = self._get_states(workflow_class, index)
+        errors = []
+
+        # The automatic transition always run from each state, if any
+        next_transitions = {}
+        for state in self.states:
+            transitions = index.for_source(state)
+            if state in exit_checks:
+                # Leaving this state is always subject to a check
+                continue
+            unconditional = [t for t in transitions if t["name"] not in conditional]
+            if len(unconditional) > 1 and not all(
+                t.get("manual", False) for t in unconditional
+            ):
+                names = ", ".join(t["name"] for t in unconditional)
+                errors.append(
+                    f"ambiguous automatic transitions from state {state}: {names}"
+                )
+            elif (
+                len(transitions) == 1
+                and unconditional
+                and not unconditional[0].get("manual", False)
+            ):
+                next_transitions[state] = unconditional[0]
+
+        # Chain of automatic transitions leading from each state to its resting state.
+        # Chains leading to a cycle are not kept: advancing from their states must fail
+        # as it would without the analysis.
+        automatic_paths, cycles = {}, set()
+        for state in next_transitions:
+            path, visited, current = [], [state], state
+            while current in next_transitions:
+                transition = next_transitions[current]
+                path.append(transition)
+                current = transition["destination"]
+                if current in visited:
+                    cycle = visited[visited.index(current) :]
+                    if frozenset(cycle) not in cycles:
+                        cycles.add(frozenset(cycle))
+                        cycle = " -> ".join([*cycle, current])
+                        errors.append(f"automatic transitions cycle: {cycle}")
+                    path = None
+                    break
+                visited.append(current)
+            if path:
+                automatic_paths[state] = tuple(path)
+        self.automatic_paths = MappingProxyType(automatic_paths)
+        self.errors = tuple(errors)
+
+        self.unreachable_states = self._get_unreachable_states(workflow_class, index)
+
+    def _get_states(self, workflow_class, index):
+        states = getattr(workflow_class, "states", None) or []
+        if hasattr(states, "values") and isinstance(states.values, dict):
+            # Django extended choices
+            names = list(states.values.keys())
+        else:
+            names = [s[0] if isinstance(s, tuple) else s for s in states]
+        names = [s for s in names if isinstance(s, str)]
+
+        for transition in index.by_name.values():
+            sources = transition["source"]
+            for source in sources if isinstance(sources, list) else [sources]:
+                if source != workflow_class.wildcard_state and source not in names:
+                    names.append(source)
+            if transition["destination"] not in names:
+                names.append(transition["destination"])
+        return tuple(names)
+
+    def _get_unreachable_states(self, workflow_class, index):
+        if not self.states:
+            return ()
+
+        initial_state = workflow_class._get_default_initial_state()
+        reachable, pending = {initial_state}, [initial_state]
+        while pending:
+            for transition in index.for_source(pending.pop()):
+                if transition["destination"] not in reachable:
+                    reachable.add(transition["destination"])
+                    pending.append(transition["destination"])
+        return tuple(s for s in self.states if s not in reachable)
+
+    @staticmethod
+    def _get_conditions(workflow_class, index):
+        """
+        Return the names of the transitions whose execution depends on a check,
+        and the states that cannot be left without a check.
+        """
+        if (
+            workflow_class.check_transition_condition
+            is not PieuvreWorkflow.check_transition_condition
+        ):
+            # Custom conditions: nothing can be assumed
+            return set(index.by_name), set()
+
+        enter_checks, exit_checks = set(), set()
+        for attr in dir(workflow_class):
+            if attr.startswith("__"):
+                continue
+            func = getattr(workflow_class, attr, None)
+            enter_checks.update(getattr(func, "_on_enter_state_check", None) or [])
+            exit_checks.update(getattr(func, "_on_exit_state_check", None) or [])
+
+        conditional = {
+            transition["name"]
+            for transition in index.by_name.values()
+            if hasattr(workflow_class, f"check_{transition['name']}")
+            or transition["destination"] in enter_checks
+        }
+        return conditional, exit_checks
+
+    def get_automatic_path(self, state):
+        """
+        Return the automatic transitions that are always run from the given state,
+        until a state requiring a decision at runtime is reached.
+        """
+        return self.automatic_paths.get(state, ())
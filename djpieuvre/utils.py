@@ -1,8 +1,11 @@
 import re
 from functools import cache
+from itertools import islice
 
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import Q, QuerySet
+
+from djpieuvre.constants import TASK_PRINCIPAL_TYPES
 
 
 # from https://stackoverflow.com/a/1176023/13837279
@@ -21,17 +24,108 @@ def get_app_name(model):
     return ContentType.objects.get_for_model(model).app_label
 
 
-def get_task_predicate(user):
+@cache
+def get_permission_codenames(model):
+    """
+    Return the codenames of the custom permissions of the model (`Meta.permissions`).
+    """
+    return frozenset(perm[0] for perm in model._meta.permissions)
+
+
+def get_repr_snapshot(target):
+    """
+    Return the representation of a task target stored on its tasks
+    (see `WorkflowEnabled.task_repr`).
+    """
+    try:
+        value = target.task_repr()
+    except AttributeError:
+        return None
+    return None if value is None else str(value)
+
+
+def get_pks(objs):
+    """
+    Return the primary keys of a queryset (without loading its objects), or of an iterable
+    of model instances or primary keys.
+    """
+    if isinstance(objs, QuerySet):
+        return frozenset(objs.values_list("pk", flat=True))
+    return frozenset(getattr(obj, "pk", obj) for obj in objs)
+
+
+async def aget_pks(objs):
+    """
+    Async version of `get_pks`: querysets are evaluated with the async ORM.
+    """
+    if isinstance(objs, QuerySet):
+        return frozenset([pk async for pk in objs.values_list("pk", flat=True)])
+    return get_pks(objs)
+
+
+async def aget_content_type(model=None, pk=None):
+    """
+    Return the content type of a model (or with a given primary key), like
+    `ContentType.objects.get_for_model` and `get_for_id` which cannot be called from async code
+    the first time they read a content type.
+    Content types read here are added to the cache of the ContentType manager.
+    """
+    manager = ContentType.objects
+    if model is not None:
+        opts = manager._get_opts(model, True)
+        try:
+            return manager._get_from_cache(opts)
+        except KeyError:
+            content_type, _ = await manager.aget_or_create(
+                app_label=opts.app_label, model=opts.model_name
+            )
+    else:
+        try:
+            return manager._cache[manager.db][pk]
+        except KeyError:
+            content_type = await manager.aget(pk=pk)
+
+    manager._add_to_cache(manager.db, content_type)
+    return content_type
+
+
+def batched(iterable, size):
+    """
+    Split an iterable into lists of at most `size` elements.
+    Querysets are iterated in chunks so that they are not loaded at once.
+    """
+    if isinstance(iterable, QuerySet):
+        iterable = iterable.iterator(chunk_size=size)
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def get_task_predicate(user, open_only=False):
+    """
+    Return a filter on PieuvreTask matching the tasks the user can access, or only their open
+    tasks if `open_only` is True.
+    It is a single semi-join on the assignee index (see `PieuvreTaskAssignee`), so tasks
+    are not duplicated when they are assigned to several principals of the user.
+    """
+    from djpieuvre.models import PieuvreTaskAssignee
+
     # User is always defined in our case, thanks to the IsAuthenticated permission, but this allows
     # a superclass to remove the need for auth
     # First filter: the task is not assigned at all. Might apply to unauthenticated users
-    f = Q(users__isnull=True) & Q(groups__isnull=True)
-    if user:
+    f = Q(principal_type=TASK_PRINCIPAL_TYPES.EVERYONE)
+    if user and user.is_authenticated:
         f = (
             f
-            | Q(users=user)  # Or current user is assigned
-            | Q(  # Or current user belongs to a group that is assigned
-                groups__in=user.groups.all()
+            # Or current user is assigned
+            | Q(principal_type=TASK_PRINCIPAL_TYPES.USER, principal_id=user.pk)
+            # Or current user belongs to a group that is assigned
+            | Q(
+                principal_type=TASK_PRINCIPAL_TYPES.GROUP,
+                principal_id__in=user.groups.values("pk"),
             )
         )
-    return f
+    if open_only:
+        f &= Q(is_open=True)
+    return Q(pk__in=PieuvreTaskAssignee.objects.filter(f).values("task_id"))
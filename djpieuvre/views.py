@@ -1,19 +1,26 @@
 from collections import defaultdict
 
+from django.contrib.contenttypes.models import ContentType
 from django.db.models import QuerySet, prefetch_related_objects
 from django_filters import rest_framework as filters
 from drf_spectacular.utils import extend_schema
 from rest_framework import mixins, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from djpieuvre import utils
+from djpieuvre.conf import get_setting
 from djpieuvre.constants import TASK_STATES
+from djpieuvre.counters import get_open_task_counts
+from djpieuvre.drf_mixins import WorkflowScopeMixin
 from djpieuvre.models import PieuvreTask
+from djpieuvre.pagination import TaskCursorPagination
 from djpieuvre.serializers import (
     PieuvreTaskListSerializer,
     PieuvreTaskDetailSerializer,
     PieuvreTaskCompleteSerializer,
+    TaskCountsSerializer,
 )
 
 
@@ -21,25 +28,45 @@ class TaskFilterSet(filters.FilterSet):
     status = filters.ChoiceFilter(
         field_name="state", label="Status", choices=TASK_STATES
     )
+    workflow = filters.CharFilter(field_name="workflow_name", label="Workflow")
+    model = filters.CharFilter(method="filter_model", label="Model")
+    model_id = filters.NumberFilter(field_name="object_id", label="Model id")
 
     class Meta:
         model = PieuvreTask
-        fields = ["status"]
+        fields = ["status", "workflow", "model", "model_id"]
+
+    @staticmethod
+    def filter_model(queryset, name, value):
+        # Content types are looked up first so that the tasks table is not joined
+        return queryset.filter(
+            content_type__in=ContentType.objects.filter(model=value).values("pk")
+        )
 
 
 class TaskViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    WorkflowScopeMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
 ):
     """
     Viewset to handle tasks
     """
 
-    queryset = PieuvreTask.objects.select_related("process__content_type").all()
+    queryset = PieuvreTask.objects.select_related("process").all()
     serializer_class = PieuvreTaskListSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = TaskFilterSet
 
+    @property
+    def pagination_class(self):
+        # Cursor pagination is opt-in, so that clients expecting a plain list are not broken
+        if get_setting("TASK_PAGE_SIZE"):
+            return TaskCursorPagination
+        return api_settings.DEFAULT_PAGINATION_CLASS
+
     def get_serializer_class(self):
         if self.action in ("retrieve", "complete"):
             return PieuvreTaskDetailSerializer
@@ -56,23 +83,28 @@ class TaskViewSet(
         """
         This is a hack to prefetch the tasks process target instances. Since there are multiple
         target models, we cannot use `prefetch_related`.
-        We could directly use prefetch_related_objects but then we could not prefetch some specific fields
-        for each model, so we need to group the objects by target model, then use `prefetch_related_objects`.
+        We could directly use prefetch_related_objects but then we could not prefetch some
+        specific fields for each model, so we need to group the objects by target model,
+        then use `prefetch_related_objects`.
         """
         if isinstance(objs, QuerySet):
             # Materialize the queryset so that we only deal with lists
             objs = list(objs)
 
+        if get_setting("TASK_REPR_SNAPSHOT"):
+            # Targets are not needed: their representation is stored on the tasks
+            return objs
+
         # Group all PieuvreTasks by content type
         objs_by_type = defaultdict(list)
         for obj in objs:
-            objs_by_type[obj.process.content_type_id].append(obj)
+            objs_by_type[obj.content_type_id].append(obj)
 
         # Now prefetch the data we need
         lookup_prefix = "process__process_target"
         for content_type, content_type_objs in objs_by_type.items():
             # There is at least one element of this type so the following is safe
-            model_class = content_type_objs[0].process.content_type.model_class()
+            model_class = ContentType.objects.get_for_id(content_type).model_class()
             # From that we can get the fields we need to prefetch in order to optimize even more
             if hasattr(model_class, "task_repr") and hasattr(
                 model_class.task_repr, "select_related"
@@ -95,7 +127,12 @@ class TaskViewSet(
         qs = super().get_queryset()
         user = self.request.user
 
-        f = utils.get_task_predicate(user)
+        # Closed tasks are skipped in the assignee index when only open tasks are listed
+        open_only = (
+            self.action == "counts"
+            or self.request.query_params.get("status") == TASK_STATES.CREATED
+        )
+        f = utils.get_task_predicate(user, open_only=open_only)
         return qs.filter(f)
 
     @extend_schema(request=PieuvreTaskCompleteSerializer)
@@ -111,3 +148,12 @@ class TaskViewSet(
         serializer = self.get_serializer(task)
 
         return Response(serializer.data)
+
+    @extend_schema(responses=TaskCountsSerializer)
+    @action(detail=False, methods=["get"])
+    def counts(self, request, *args, **kwargs):
+        """
+        Return the number of open tasks of the current user, per workflow and per state.
+        """
+        counts = get_open_task_counts(request.user, self.get_queryset())
+        return Response(TaskCountsSerializer(counts).data)
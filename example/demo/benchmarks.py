@@ -0,0 +1,169 @@
+"""
+Benchmarks of the workflow operations and endpoints, run with the `pieuvre_benchmark`
+management command. Results are reported as JSON so that they can be compared between releases.
+"""
+
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from djpieuvre.constants import TASK_STATES
+from djpieuvre.models import PieuvreTask
+from .models import MyProcess
+from .workflows import (
+    MyFirstWorkflow1,
+    MyFirstWorkflow2,
+    MyFirstWorkflow3,
+    MyFirstWorkflow4,
+    MyFirstWorkflow5,
+)
+
+User = get_user_model()
+
+# Workflows applying to every MyProcess instance
+WORKFLOWS = [
+    MyFirstWorkflow1,
+    MyFirstWorkflow2,
+    MyFirstWorkflow3,
+    MyFirstWorkflow4,
+    MyFirstWorkflow5,
+]
+
+
+class Benchmark:
+    """
+    Collects the duration and the number of queries of each operation.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.durations = []
+        self.queries = []
+
+    def measure(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.durations.append(time.perf_counter() - start)
+        self.queries.append(len(ctx.captured_queries))
+        return result
+
+    def report(self):
+        if not self.durations:
+            return {"ops": 0}
+
+        total = sum(self.durations)
+        durations = sorted(self.durations)
+        return {
+            "ops": len(durations),
+            "ops_per_sec": round(len(durations) / total, 2) if total else None,
+            "p50_ms": round(_percentile(durations, 50) * 1000, 3),
+            "p99_ms": round(_percentile(durations, 99) * 1000, 3),
+            "queries": {
+                "total": sum(self.queries),
+                "mean": round(statistics.mean(self.queries), 2),
+                "max": max(self.queries),
+            },
+        }
+
+
+def _percentile(values, percent):
+    # Nearest-rank percentile of sorted values
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[index]
+
+
+def _get(client, url, data=None):
+    response = client.get(url, data)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return response
+
+
+def seed(targets):
+    """
+    Create the user, groups and targets used by the benchmarks.
+    """
+    user = User.objects.create(username=f"benchmark-{time.time_ns()}")
+    for name in ("Completers", "Researcher", "Evaluator"):
+        group, _ = Group.objects.get_or_create(name=f"{name} benchmark")
+        user.groups.add(group)
+
+    MyProcess.objects.bulk_create(
+        [MyProcess(my_property=f"benchmark {i}") for i in range(targets)]
+    )
+    objects = list(MyProcess.objects.order_by("-pk")[:targets])
+    return user, objects
+
+
+def run(targets=100, workflows=len(WORKFLOWS), requests=50):
+    """
+    Seed `targets` objects with `workflows` workflows each and run the benchmarks.
+    Everything is rolled back once the benchmarks are done.
+    """
+    workflow_classes = WORKFLOWS[:workflows]
+    benchmarks = {
+        name: Benchmark(name)
+        for name in (
+            "advance_workflow",
+            "workflow_instances",
+            "task_complete",
+            "task_list",
+            "workflows_action",
+        )
+    }
+
+    # The test client uses the "testserver" host name
+    allowed_hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+    with override_settings(ALLOWED_HOSTS=allowed_hosts), transaction.atomic():
+        user, objects = seed(targets)
+        pks = [obj.pk for obj in objects]
+
+        for obj in objects:
+            for workflow_class in workflow_classes:
+                workflow = workflow_class(obj)
+                benchmarks["advance_workflow"].measure(workflow.advance_workflow)
+
+        for obj in MyProcess.objects.with_workflow_processes().filter(pk__in=pks):
+            benchmarks["workflow_instances"].measure(lambda: obj.workflow_instances)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        for i in range(requests):
+            benchmarks["task_list"].measure(
+                _get,
+                client,
+                reverse("pieuvretask-list"),
+                {"status": TASK_STATES.CREATED},
+            )
+        for pk in pks[:requests]:
+            benchmarks["workflows_action"].measure(
+                _get, client, reverse("myprocess-workflows", kwargs={"pk": pk})
+            )
+
+        tasks = PieuvreTask.objects.filter(
+            object_id__in=pks,
+            workflow_name=MyFirstWorkflow1.name,
+            state=TASK_STATES.CREATED,
+        ).select_related("process")
+        for task in tasks:
+            benchmarks["task_complete"].measure(task.complete, "finish")
+
+        transaction.set_rollback(True)
+
+    return {
+        "parameters": {
+            "targets": targets,
+            "workflows": [w.name for w in workflow_classes],
+            "requests": requests,
+            "database": connection.vendor,
+        },
+        "results": {name: b.report() for name, b in benchmarks.items()},
+    }
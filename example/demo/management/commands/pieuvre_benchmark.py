@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from demo import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the workflow operations and endpoints, and print the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--targets", type=int, default=100, help="Number of objects to seed"
+        )
+        parser.add_argument(
+            "--workflows",
+            type=int,
+            default=len(benchmarks.WORKFLOWS),
+            help="Number of demo workflows started on each object",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Number of requests sent to each endpoint",
+        )
+        parser.add_argument("--output", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        if not 1 <= options["workflows"] <= len(benchmarks.WORKFLOWS):
+            raise CommandError(
+                f"--workflows must be between 1 and {len(benchmarks.WORKFLOWS)}"
+            )
+
+        results = benchmarks.run(
+            targets=options["targets"],
+            workflows=options["workflows"],
+            requests=options["requests"],
+        )
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -1,11 +1,13 @@
 from django.db import models
 
-from djpieuvre.mixins import WorkflowEnabled
+from djpieuvre.mixins import WorkflowEnabled, WorkflowEnabledManager
 
 
 class MyProcess(WorkflowEnabled, models.Model):
     my_property = models.TextField()
 
+    objects = WorkflowEnabledManager()
+
     def task_repr(self):
         return self.my_property
 
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from djpieuvre.serializers import InstanceWorkflowSerializer
+from djpieuvre.serializers import (
+    InstanceWorkflowListSerializer,
+    InstanceWorkflowSerializer,
+)
 from .models import MyProcess
 
 
@@ -8,3 +11,4 @@ class MyProcessSerializer(InstanceWorkflowSerializer, serializers.ModelSerialize
     class Meta:
         model = MyProcess
         fields = ["my_property", "workflows"]
+        list_serializer_class = InstanceWorkflowListSerializer
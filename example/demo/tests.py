@@ -1,14 +1,38 @@
+import asyncio
+import json
 import time
+from io import StringIO
+from unittest import mock, skipUnless
 
 import factory
+from django.apps import apps
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
+from pieuvre.exceptions import CircularWorkflowError
 from rest_framework.test import APITestCase
 
-from djpieuvre.constants import TASK_STATES
-from djpieuvre.models import PieuvreTask
+from djpieuvre import on_task_assign_group, on_task_assign_user
+from djpieuvre.authorization import get_authorization_snapshot
+from djpieuvre.cache import _MISSING, CacheInfo, clear_hook_cache, get_hook_cache
+from djpieuvre.checks import check_workflow_graphs
+from djpieuvre.constants import (
+    TASK_PRINCIPAL_TYPES,
+    TASK_STATES,
+    WORKFLOW_PERM_SUFFIX_READ,
+)
+from djpieuvre.core import Workflow, get as get_workflow, get_metadata
+from djpieuvre.exceptions import HookTimeout, StaleProcess, WorkflowDoesNotExist
+from djpieuvre.identity import workflow_scope
+from djpieuvre.models import PieuvreProcess, PieuvreTask, PieuvreTaskAssignee
+from djpieuvre.utils import get_task_predicate
 from .models import MyProcess
 from .workflows import (
     MyFirstWorkflow1,
@@ -18,6 +42,9 @@ from .workflows import (
     MyFirstWorkflow5,
 )
 
+# Hook results are not cached unless a hook cache is configured
+LOCAL_HOOK_CACHE = {"HOOK_CACHE": {"BACKEND": "djpieuvre.cache.LocalHookCache"}}
+
 
 class UserFactory(factory.django.DjangoModelFactory):
     username = factory.Faker("user_name")
@@ -35,7 +62,14 @@ class GroupFactory(factory.django.DjangoModelFactory):
         model = Group
 
 
-class TasksTests(APITestCase):
+class PieuvreTestCase(APITestCase):
+    def setUp(self):
+        # Hook results are cached for the whole process, but the database is rolled back
+        # between tests
+        clear_hook_cache()
+
+
+class TasksTests(PieuvreTestCase):
     @staticmethod
     def _advance_and_reload_workflow(workflow_class, instance, *args, **kwargs):
         wf = workflow_class(instance, *args, **kwargs)
@@ -73,13 +107,13 @@ class TasksTests(APITestCase):
         self.assertEqual(task.task, "submitted")
 
     def test_workflow_task_assignment(self):
-        users = [UserFactory() for i in range(20)]
+        UserFactory.create_batch(20)
         user = User.objects.last()
-        groups = [GroupFactory() for i in range(10)]
+        GroupFactory.create_batch(10)
         group = GroupFactory(name="Completers Team")
         user.groups.add(group)
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow2, process, initial_state="in_progress"
         )
         # There should be a task, assigned to the user and the group
@@ -89,15 +123,24 @@ class TasksTests(APITestCase):
         self.assertEqual(list(task.groups.all()), [group])
 
 
+class FailingCompletionWorkflow(MyFirstWorkflow2):
+    # Not registered on MyProcess, so that the workflows of its instances are unchanged
+    target_model = None
+
+    def before_complete(self, *args, **kwargs):
+        raise RuntimeError("Completion failed")
+
+
 class AuthenticatedTasksTests(TasksTests):
     def setUp(self, password=None):
+        super().setUp()
         self.user = UserFactory()
         self.user.save()
         self.client.force_authenticate(user=self.user)
 
     def test_user_can_get_tasks(self):
         process = MyProcess.objects.create(my_property="unique-prop")
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow1, process, initial_state="submitted"
         )
         response = self.client.get(reverse("pieuvretask-list"))
@@ -145,7 +188,7 @@ class AuthenticatedTasksTests(TasksTests):
         group = GroupFactory(name="Completers Team")
         user.groups.add(group)
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow2, process, initial_state="in_progress"
         )
         # user has been assigned the task because he is in the Completers Team
@@ -181,7 +224,7 @@ class AuthenticatedTasksTests(TasksTests):
 
     def test_user_can_only_get_authorized_workflows(self):
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow1, process, initial_state="submitted"
         )
         response = self.client.get(
@@ -206,7 +249,7 @@ class AuthenticatedTasksTests(TasksTests):
 
     def test_unauthorized_user_cannot_get_manual_transition(self):
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow3, process, initial_state="progressing"
         )
         response = self.client.get(
@@ -239,6 +282,7 @@ class AuthenticatedTasksTests(TasksTests):
         self.assertEqual(task["workflows"][1]["state"], "progressing")
         self.assertEqual(len(task["workflows"][1]["transitions"]), 1)
 
+    @override_settings(DJPIEUVRE=LOCAL_HOOK_CACHE)
     def test_caching(self):
         process = MyProcess.objects.create()
         wf = self._advance_and_reload_workflow(MyFirstWorkflow3, process)
@@ -254,9 +298,98 @@ class AuthenticatedTasksTests(TasksTests):
                 len(wf.groups_who_can_complete(tuple(wf.transitions[1].items())))
             self.assertEqual(wf.groups_who_can_complete.cache_info().hits, i)
 
+    def test_task_assigned_to_user_and_group_is_listed_once(self):
+        group = GroupFactory(name="Completers Team")
+        self.user.groups.add(group)
+        process = MyProcess.objects.create()
+        self._advance_and_reload_workflow(
+            MyFirstWorkflow2, process, initial_state="in_progress"
+        )
+        task = PieuvreTask.objects.get()
+        self.assertEqual(
+            set(task.assignees.values_list("principal_type", "principal_id")),
+            {
+                (TASK_PRINCIPAL_TYPES.USER, self.user.pk),
+                (TASK_PRINCIPAL_TYPES.GROUP, group.pk),
+            },
+        )
+
+        response = self.client.get(reverse("pieuvretask-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 1)
+
+        task.complete("complete")
+        self.assertFalse(task.assignees.filter(is_open=True).exists())
+        self.assertTrue(
+            PieuvreTask.objects.filter(get_task_predicate(self.user)).exists()
+        )
+        self.assertFalse(
+            PieuvreTask.objects.filter(
+                get_task_predicate(self.user, open_only=True)
+            ).exists()
+        )
+
+    def test_unassigned_task_is_listed(self):
+        wf = MyFirstWorkflow2(MyProcess.objects.create(), initial_state="in_progress")
+        wf._persist_process()
+        # Created without `assign`
+        task = PieuvreTask.objects.create(
+            process=wf.model, task="in_progress", name="In progress"
+        )
+        self.assertEqual(
+            list(task.assignees.values_list("principal_type", "principal_id")),
+            [(TASK_PRINCIPAL_TYPES.EVERYONE, 0)],
+        )
+
+        response = self.client.get(reverse("pieuvretask-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([t["id"] for t in response.json()], [task.pk])
+
+    def test_assignees_stay_open_when_the_transition_fails(self):
+        self.user.groups.add(GroupFactory(name="Completers Team"))
+        self._advance_and_reload_workflow(
+            FailingCompletionWorkflow,
+            MyProcess.objects.create(),
+            initial_state="in_progress",
+        )
+        task = PieuvreTask.objects.get()
+        with self.assertRaises(RuntimeError):
+            task.complete("complete")
+
+        self.assertEqual(
+            set(
+                PieuvreTaskAssignee.objects.filter(task=task).values_list(
+                    "principal_type", "is_open"
+                )
+            ),
+            {(TASK_PRINCIPAL_TYPES.USER, True), (TASK_PRINCIPAL_TYPES.GROUP, True)},
+        )
+        self.assertTrue(
+            PieuvreTask.objects.filter(
+                get_task_predicate(self.user, open_only=True)
+            ).exists()
+        )
+
+    @override_settings(DJPIEUVRE=LOCAL_HOOK_CACHE)
+    def test_caching_is_shared_between_instances(self):
+        group = GroupFactory(name="Completers Team")
+        wf = MyFirstWorkflow3(MyProcess.objects.create())
+        other_wf = MyFirstWorkflow3(MyProcess.objects.create())
+        transition = tuple(wf.transitions[1].items())
+
+        self.assertEqual(wf.groups_who_can_complete(transition), [group])
+        with self.assertNumQueries(0):
+            # Results are shared by all instances of the workflow
+            self.assertEqual(other_wf.groups_who_can_complete(transition), [group])
+
+        self.assertEqual(wf.users_who_can_complete(transition), [])
+        # Group membership changes invalidate the cache
+        self.user.groups.add(group)
+        self.assertEqual(other_wf.users_who_can_complete(transition), [self.user])
+
     def test_task_detail_view_contains_next_available_transitions(self):
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow4, process, initial_state="edited"
         )
         # The current user is a researcher
@@ -278,7 +411,7 @@ class AuthenticatedTasksTests(TasksTests):
 
     def test_user_should_be_able_to_choose_transition_to_be_executed(self):
         process = MyProcess.objects.create()
-        wf = self._advance_and_reload_workflow(
+        self._advance_and_reload_workflow(
             MyFirstWorkflow4, process, initial_state="submitted"
         )
         # The current user is a researcher
@@ -348,10 +481,514 @@ class AuthenticatedTasksTests(TasksTests):
         js = response.data
         self.assertEqual(len(js), 1)
 
+    def test_task_routing_filters(self):
+        process1 = MyProcess.objects.create()
+        process2 = MyProcess.objects.create()
+        for process in (process1, process2):
+            MyFirstWorkflow3(process, initial_state="progressing").advance_workflow()
+        MyFirstWorkflow1(process1, initial_state="submitted").advance_workflow()
+
+        # Routing fields are copied from the process
+        task = PieuvreTask.objects.get(workflow_name=MyFirstWorkflow1.name)
+        self.assertEqual(task.content_type, task.process.content_type)
+        self.assertEqual(task.object_id, process1.pk)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                reverse("pieuvretask-list"),
+                data={"workflow": MyFirstWorkflow3.name, "model_id": process2.pk},
+            )
+        self.assertEqual(
+            [(t["process_name"], t["model_id"]) for t in response.data],
+            [(MyFirstWorkflow3.name, str(process2.pk))],
+        )
+        # Tasks are filtered on their own columns, not on the processes ones
+        task_query = next(
+            q["sql"]
+            for q in ctx.captured_queries
+            if f'FROM "{PieuvreTask._meta.db_table}"' in q["sql"]
+        )
+        where = task_query.split(" WHERE ", 1)[1]
+        for field in ("workflow_name", "object_id"):
+            self.assertNotIn(f'"{PieuvreProcess._meta.db_table}"."{field}"', where)
+
+        response = self.client.get(
+            reverse("pieuvretask-list"), data={"model": "myprocess"}
+        )
+        self.assertEqual(len(response.data), 3)
+        response = self.client.get(
+            reverse("pieuvretask-list"), data={"model": "doesnotexist"}
+        )
+        self.assertEqual(len(response.data), 0)
+
+
+class TaskPaginationTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        for i in range(3):
+            MyFirstWorkflow1(
+                MyProcess.objects.create(), initial_state="submitted"
+            ).advance_workflow()
+
+    def test_task_list_is_not_paginated_by_default(self):
+        response = self.client.get(reverse("pieuvretask-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 3)
+
+    @override_settings(DJPIEUVRE={"TASK_PAGE_SIZE": 2})
+    def test_task_list_cursor_pagination(self):
+        tasks = list(PieuvreTask.objects.order_by("-created_at", "-id"))
+        response = self.client.get(
+            reverse("pieuvretask-list"), data={"status": TASK_STATES.CREATED}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = response.json()
+        self.assertEqual([t["id"] for t in page["results"]], [t.pk for t in tasks[:2]])
+        self.assertIsNotNone(page["next"])
+
+        response = self.client.get(page["next"])
+        page = response.json()
+        self.assertEqual([t["id"] for t in page["results"]], [tasks[2].pk])
+        self.assertIsNone(page["next"])
+
+        # The status filter still applies
+        response = self.client.get(
+            reverse("pieuvretask-list"), data={"status": TASK_STATES.DONE}
+        )
+        self.assertEqual(response.json()["results"], [])
+
+
+class TaskCountsTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        for i in range(2):
+            MyFirstWorkflow1(
+                MyProcess.objects.create(), initial_state="submitted"
+            ).advance_workflow()
+
+    def test_task_counts(self):
+        response = self.client.get(reverse("pieuvretask-counts"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task = PieuvreTask.objects.first()
+        workflow_name = task.process.workflow_name
+        self.assertEqual(
+            response.json(),
+            {
+                "total": 2,
+                "workflows": {
+                    workflow_name: {"total": 2, "states": {task.task: 2}},
+                },
+            },
+        )
+
+        # Counts are served from the cache
+        with self.assertNumQueries(0):
+            self.client.get(reverse("pieuvretask-counts"))
+
+        # Completing a task invalidates the counts
+        self.client.post(
+            reverse("pieuvretask-complete", kwargs={"pk": task.pk}),
+            data={"transition": "finish"},
+        )
+        response = self.client.get(reverse("pieuvretask-counts"))
+        # The completed task is replaced by a task in the next state
+        self.assertEqual(
+            response.json()["workflows"][workflow_name]["states"],
+            {task.task: 1, "done": 1},
+        )
+
+    @override_settings(DJPIEUVRE={"TASK_COUNTS_CACHE": None})
+    def test_task_counts_without_cache(self):
+        response = self.client.get(reverse("pieuvretask-counts"))
+        self.assertEqual(response.json()["total"], 2)
+
+        # Tasks of other users are not counted
+        self.client.force_authenticate(user=UserFactory())
+        PieuvreTask.objects.update(state=TASK_STATES.DONE)
+        response = self.client.get(reverse("pieuvretask-counts"))
+        self.assertEqual(response.json(), {"total": 0, "workflows": {}})
+
+
+@skipUnless(
+    connection.vendor in ("sqlite", "postgresql"), "Query plans are backend specific"
+)
+class QueryPlanTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        if connection.vendor == "postgresql":
+            # Tables are too small for Postgres to prefer indexes over sequential scans
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_inbox_uses_open_tasks_index(self):
+        queryset = (
+            PieuvreTask.objects.select_related("process__content_type")
+            .filter(
+                get_task_predicate(self.user, open_only=True),
+                state=TASK_STATES.CREATED,
+            )
+            .order_by("-created_at", "-id")
+        )
+        self.assertUsesIndex(
+            queryset, "djpieuvre_task_open_idx", "djpieuvre_task_state_idx"
+        )
+
+    def test_task_creation_uses_process_index(self):
+        process = PieuvreProcess.objects.create(
+            process_target=MyProcess.objects.create(),
+            workflow_name="MyFirstWorkflow1",
+            state="submitted",
+        )
+        # Same lookup as the get_or_create of `_advance_workflow`
+        queryset = PieuvreTask.objects.filter(
+            process=process, task="submitted", state=TASK_STATES.CREATED
+        ).order_by()
+        self.assertUsesIndex(queryset, "djpieuvre_task_process_idx")
+
+
+# Budgets are measured with the hook cache that hooks of the demo workflows opt into
+@override_settings(DJPIEUVRE=LOCAL_HOOK_CACHE)
+class QueryBudgetTest(PieuvreTestCase):
+    """
+    Maximum number of queries of the main operations. Each operation is run against datasets
+    of different sizes (see `setup_<operation>`), and its number of queries must not depend
+    on the size.
+    """
+
+    sizes = (1, 10)
+    budgets = {
+        "task_list": 2,
+        "task_retrieve": 4,
+        "task_complete": 19,
+        "workflows_action": 14,
+        "workflows_list": 8,
+        "advance_workflow_action": 27,
+        "advance_workflow": 12,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        # Warm up the content types cache
+        ContentType.objects.get_for_model(MyProcess)
+
+    def assertQueryBudget(self, operation):
+        counts = {}
+        for size in self.sizes:
+            with transaction.atomic():
+                func = getattr(self, f"setup_{operation}")(size)
+                clear_hook_cache()
+                # Permissions are cached on the user instance
+                self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+                with CaptureQueriesContext(connection) as ctx:
+                    func()
+                counts[size] = len(ctx.captured_queries)
+                transaction.set_rollback(True)
+
+        self.assertEqual(
+            len(set(counts.values())),
+            1,
+            f"Queries of {operation} grow with the number of rows: {counts}",
+        )
+        self.assertLessEqual(
+            counts[self.sizes[0]],
+            self.budgets[operation],
+            f"Queries of {operation} exceed the budget",
+        )
+
+    def _create_completers(self, size):
+        groups = GroupFactory.create_batch(
+            size, name=factory.Sequence("Completers {}".format)
+        )
+        self.user.groups.add(*groups)
+        for group in groups:
+            group.user_set.add(*UserFactory.create_batch(2))
+
+    def setup_task_list(self, size):
+        for i in range(size):
+            MyFirstWorkflow1(
+                MyProcess.objects.create(my_property=f"process {i}"),
+                initial_state="submitted",
+            ).advance_workflow()
+        return lambda: self.client.get(reverse("pieuvretask-list"))
+
+    def setup_task_retrieve(self, size):
+        self._create_completers(size)
+        MyFirstWorkflow2(
+            MyProcess.objects.create(), initial_state="in_progress"
+        ).advance_workflow()
+        task = PieuvreTask.objects.get()
+        return lambda: self.client.get(
+            reverse("pieuvretask-detail", kwargs={"pk": task.pk})
+        )
+
+    def setup_task_complete(self, size):
+        UserFactory.create_batch(size)
+        MyFirstWorkflow1(
+            MyProcess.objects.create(), initial_state="submitted"
+        ).advance_workflow()
+        task = PieuvreTask.objects.get()
+        return lambda: self.client.post(
+            reverse("pieuvretask-complete", kwargs={"pk": task.pk}),
+            data={"transition": "finish"},
+        )
+
+    def setup_workflows_action(self, size):
+        self._create_completers(size)
+        process = MyProcess.objects.create()
+        for workflow_class in (MyFirstWorkflow2, MyFirstWorkflow3):
+            workflow_class(process, initial_state="in_progress").advance_workflow()
+        return lambda: self.client.get(
+            reverse("myprocess-workflows", kwargs={"pk": process.pk})
+        )
+
+    def setup_workflows_list(self, size):
+        self._create_completers(1)
+        for i in range(size):
+            process = MyProcess.objects.create()
+            MyFirstWorkflow3(process, initial_state="progressing").advance_workflow()
+            # Create the processes of the other workflows
+            process.workflow_instances
+        return lambda: self.client.get(reverse("myprocess-list"))
+
+    def setup_advance_workflow_action(self, size):
+        UserFactory.create_batch(size)
+        process = MyProcess.objects.create()
+        workflow = MyFirstWorkflow1(process)
+        return lambda: self.client.post(
+            reverse("myprocess-advance-workflow", args=[process.pk]),
+            data={"workflow": workflow.model.pk},
+            format="json",
+        )
+
+    def setup_advance_workflow(self, size):
+        UserFactory.create_batch(size)
+        workflow = MyFirstWorkflow1(MyProcess.objects.create())
+        return workflow.advance_workflow
+
+    def test_task_list(self):
+        self.assertQueryBudget("task_list")
+
+    def test_task_retrieve(self):
+        self.assertQueryBudget("task_retrieve")
+
+    def test_task_complete(self):
+        self.assertQueryBudget("task_complete")
+
+    def test_workflows_action(self):
+        self.assertQueryBudget("workflows_action")
+
+    def test_workflows_list(self):
+        self.assertQueryBudget("workflows_list")
+
+    def test_advance_workflow_action(self):
+        self.assertQueryBudget("advance_workflow_action")
+
+    def test_advance_workflow(self):
+        self.assertQueryBudget("advance_workflow")
+
+
+class BenchmarkTest(PieuvreTestCase):
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            "pieuvre_benchmark", targets=2, workflows=2, requests=1, stdout=out
+        )
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(results["advance_workflow"]["ops"], 4)
+        self.assertEqual(results["workflow_instances"]["ops"], 2)
+        self.assertEqual(results["task_complete"]["ops"], 2)
+        self.assertEqual(results["task_list"]["ops"], 1)
+        self.assertIn("p99_ms", results["workflows_action"])
+        self.assertIn("queries", results["workflows_action"])
+
+        # Benchmark data is rolled back
+        self.assertFalse(MyProcess.objects.exists())
+        self.assertFalse(PieuvreProcess.objects.exists())
+
+
+class ProcessRevisionTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.process = MyProcess.objects.create()
+
+    def _modify_concurrently(self, workflow):
+        PieuvreProcess.objects.filter(pk=workflow.model.pk).update(
+            revision=F("revision") + 1
+        )
+
+    def test_transitions_increment_the_revision(self):
+        wf = MyFirstWorkflow1(self.process)
+        self.assertEqual(wf.model.revision, 0)
+        # One automatic transition (creating the task does not update the process)
+        wf.advance_workflow()
+        self.assertEqual(wf.model.revision, 1)
+        wf.model.refresh_from_db()
+        self.assertEqual(wf.model.revision, 1)
+        self.assertEqual(wf.state, "submitted")
+
+    def test_stale_transition_is_rejected(self):
+        wf = MyFirstWorkflow4(self.process, initial_state="submitted")
+        self._modify_concurrently(wf)
+        with self.assertRaises(StaleProcess):
+            wf.accept()
+        wf.model.refresh_from_db()
+        self.assertEqual(wf.state, "submitted")
+
+    def test_stale_advance_workflow_is_retried(self):
+        wf = MyFirstWorkflow1(self.process)
+        self._modify_concurrently(wf)
+        wf.advance_workflow()
+        self.assertEqual(wf.state, "submitted")
+        self.assertEqual(PieuvreTask.objects.filter(process=wf.model).count(), 1)
+
+        wf = MyFirstWorkflow4(MyProcess.objects.create())
+        self._modify_concurrently(wf)
+        with override_settings(DJPIEUVRE={"PROCESS_UPDATE_RETRIES": 0}):
+            with self.assertRaises(StaleProcess):
+                wf.advance_workflow()
+
+    def test_complete_with_expected_revision(self):
+        wf = MyFirstWorkflow1(self.process, initial_state="submitted")
+        wf.advance_workflow()
+        task = PieuvreTask.objects.get()
+        response = self.client.get(
+            reverse("pieuvretask-detail", kwargs={"pk": task.pk})
+        )
+        self.assertEqual(response.json()["process_state"], "submitted")
+        revision = response.json()["process_revision"]
+
+        self._modify_concurrently(wf)
+        response = self.client.post(
+            reverse("pieuvretask-complete", kwargs={"pk": task.pk}),
+            data={"transition": "finish", "expected_revision": revision},
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.CREATED)
+
+        response = self.client.post(
+            reverse("pieuvretask-complete", kwargs={"pk": task.pk}),
+            data={"transition": "finish", "expected_revision": revision + 1},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.DONE)
+
+    def test_advance_workflow_with_expected_state(self):
+        wf = MyFirstWorkflow1(self.process)
+        url = reverse("myprocess-advance-workflow", args=[self.process.pk])
+        response = self.client.post(
+            url, data={"workflow": wf.model.pk, "expected_state": "submitted"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(
+            url, data={"workflow": wf.model.pk, "expected_state": "created"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["state"], "submitted")
+        self.assertEqual(response.json()["revision"], 1)
+
+    def test_open_tasks_are_unique(self):
+        wf = MyFirstWorkflow1(self.process, initial_state="submitted")
+        wf.advance_workflow()
+        task = PieuvreTask.objects.get()
+
+        self.assertEqual(
+            PieuvreTask.get_or_create_open(wf.model, "submitted", "Submitted"),
+            (task, False),
+        )
+        if connection.features.supports_partial_indexes:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                PieuvreTask.objects.create(
+                    process=wf.model, task="submitted", name="Submitted"
+                )
+
+        # No task is created for a state the process left
+        PieuvreProcess.objects.filter(pk=wf.model.pk).update(state="done")
+        with self.assertRaises(StaleProcess):
+            PieuvreTask.get_or_create_open(wf.model, "submitted", "Submitted")
+        task.state = TASK_STATES.DONE
+        task.save()
+        with self.assertRaises(StaleProcess):
+            PieuvreTask.get_or_create_open(wf.model, "submitted", "Submitted")
+
+
+class DeferredSaveTest(PieuvreTestCase):
+    def test_automatic_transitions_are_saved_once(self):
+        wf = MyFirstWorkflow5(MyProcess.objects.create())
+        with CaptureQueriesContext(connection) as ctx:
+            wf.advance_workflow()
+        # initialize and submit are automatic: the lazy process is inserted in its final state
+        process_writes = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if q["sql"].startswith(("INSERT", "UPDATE"))
+            and PieuvreProcess._meta.db_table in q["sql"].split("(")[0]
+        ]
+        self.assertEqual(len(process_writes), 1)
+        self.assertTrue(process_writes[0].startswith("INSERT"))
+
+        wf.model.refresh_from_db()
+        self.assertEqual(wf.state, "submitted")
+        self.assertEqual(wf.model.revision, 0)
+        self.assertTrue(
+            PieuvreTask.objects.filter(process=wf.model, task="submitted").exists()
+        )
+
+    def test_hooks_see_intermediate_states(self):
+        seen = []
+
+        def on_enter_edited(workflow, transition):
+            process = PieuvreProcess.objects.filter(pk=workflow.model.pk).first()
+            seen.append((workflow.state, process.state if process else None))
+
+        with mock.patch.object(
+            MyFirstWorkflow5, "on_enter_edited", on_enter_edited, create=True
+        ):
+            wf = MyFirstWorkflow5(MyProcess.objects.create(), initial_state="init")
+            wf._persist_process()
+            wf.advance_workflow()
+
+        # The hook saw the edited state, which was never saved
+        self.assertEqual(seen, [("edited", "init")])
+        wf.model.refresh_from_db()
+        self.assertEqual(wf.state, "submitted")
+        self.assertEqual(wf.model.revision, 1)
+
+    def test_failing_chain_is_rolled_back(self):
+        wf = MyFirstWorkflow5(MyProcess.objects.create())
+        wf._persist_process()
+        with mock.patch.object(
+            MyFirstWorkflow5,
+            "on_enter_submitted",
+            mock.Mock(side_effect=RuntimeError),
+            create=True,
+        ):
+            with self.assertRaises(RuntimeError):
+                wf.advance_workflow()
+
+        wf.model.refresh_from_db()
+        self.assertEqual(wf.state, "init")
+
 
 class GatewayTest(AuthenticatedTasksTests):
     def test_workflow_gateway_flow(self):
-        # we test here that we can leave a source state when there are multiple manual transitions that can be applied
+        # we test here that we can leave a source state when there are multiple manual
+        # transitions that can be applied
         # to go to the next state
         process = MyProcess.objects.create()
         wf = self._advance_and_reload_workflow(
@@ -403,7 +1040,7 @@ class GatewayTest(AuthenticatedTasksTests):
         self.assertEqual(wf.model.state, "accepted")
 
 
-class AdvanceWorkflowTest(APITestCase):
+class AdvanceWorkflowTest(PieuvreTestCase):
     def test_can_advance_workflow_from_api(self):
         process = MyProcess.objects.create()
         wflw = MyFirstWorkflow1(model=process)
@@ -417,6 +1054,31 @@ class AdvanceWorkflowTest(APITestCase):
         wflw.model.refresh_from_db()
         self.assertEqual(wflw.state, "submitted")
 
+    def test_advance_workflow_does_not_instantiate_other_workflows(self):
+        process = MyProcess.objects.create()
+        wflw = MyFirstWorkflow1(model=process)
+        with mock.patch.object(
+            MyProcess, "workflow_instances", new_callable=mock.PropertyMock
+        ) as workflow_instances:
+            r = self.client.post(
+                reverse("myprocess-advance-workflow", args=[process.pk]),
+                data={"workflow": wflw.model.pk},
+            )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["state"], "submitted")
+        workflow_instances.assert_not_called()
+
+    def test_cannot_advance_workflow_of_another_object(self):
+        process = MyProcess.objects.create()
+        other_wflw = MyFirstWorkflow1(model=MyProcess.objects.create())
+        r = self.client.post(
+            reverse("myprocess-advance-workflow", args=[process.pk]),
+            data={"workflow": other_wflw.model.pk},
+        )
+        self.assertEqual(r.status_code, 400)
+        other_wflw.model.refresh_from_db()
+        self.assertEqual(other_wflw.state, "created")
+
     def test_advance_workflow_on_already_running_workflow(self):
         process = MyProcess.objects.create()
         wflw = MyFirstWorkflow4(model=process, initial_state="edited")
@@ -461,7 +1123,7 @@ class AdvanceWorkflowTest(APITestCase):
         self.assertEqual(workflow.state, "archived")
 
 
-class WorkflowViewTest(APITestCase):
+class WorkflowViewTest(PieuvreTestCase):
     def test_can_retrieve_workflow_detail_on_model(self):
         process = MyProcess.objects.create()
         wflw = MyFirstWorkflow4(model=process, initial_state="edited")
@@ -508,6 +1170,25 @@ class WorkflowViewTest(APITestCase):
 
         self.assertEqual(len(workflows), 4)
 
+    def test_can_list_workflows_of_many_objects(self):
+        user = UserFactory()
+        user.groups.add(GroupFactory(name="Completers"))
+        self.client.force_authenticate(user=user)
+        for i in range(3):
+            MyFirstWorkflow3(
+                MyProcess.objects.create(), initial_state="progressing"
+            ).advance_workflow()
+
+        r = self.client.get(reverse("myprocess-list"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json()), 3)
+        for obj in r.json():
+            workflow = next(
+                w for w in obj["workflows"] if w["name"] == MyFirstWorkflow3.name
+            )
+            self.assertEqual(workflow["state"], "progressing")
+            self.assertEqual([t["name"] for t in workflow["transitions"]], ["complete"])
+
     def test_auto_advance_workflow_with_non_manual_task(self):
         process = MyProcess.objects.create()
         workflow = MyFirstWorkflow3(model=process, initial_state="progressing")
@@ -550,3 +1231,811 @@ class WorkflowViewTest(APITestCase):
         self.assertEqual(r.status_code, 200)
         workflow.model.refresh_from_db()
         self.assertEqual(workflow.state, "init")
+
+
+class PrefetchTest(PieuvreTestCase):
+    def test_workflow_instances_use_prefetched_processes(self):
+        processes = [MyProcess.objects.create() for i in range(5)]
+        for process in processes:
+            # Create the PieuvreProcess instances
+            self.assertEqual(len(process.workflow_instances), 5)
+
+        # One query for the objects, one for their processes
+        with self.assertNumQueries(2):
+            for process in MyProcess.objects.with_workflow_processes():
+                workflows = process.workflow_instances
+                self.assertEqual(len(workflows), 5)
+                # Lazy processes are not persisted
+                self.assertEqual(sum(1 for w in workflows if w.model.pk), 4)
+
+    def test_processes_and_tasks_are_deleted_with_target(self):
+        process = MyProcess.objects.create()
+        wf = MyFirstWorkflow1(process)
+        wf.advance_workflow()
+        self.assertTrue(PieuvreTask.objects.filter(process=wf.model).exists())
+        process.delete()
+        self.assertFalse(PieuvreProcess.objects.filter(pk=wf.model.pk).exists())
+        self.assertFalse(PieuvreTask.objects.filter(process_id=wf.model.pk).exists())
+        self.assertFalse(
+            PieuvreTaskAssignee.objects.filter(task__process_id=wf.model.pk).exists()
+        )
+
+
+class LazyProcessTest(PieuvreTestCase):
+    def test_reading_workflows_does_not_persist_lazy_process(self):
+        process = MyProcess.objects.create()
+        r = self.client.get(reverse("myprocess-workflows", args=[process.pk]))
+        self.assertEqual(r.status_code, 200)
+
+        workflow = next(
+            w for w in r.json()["workflows"] if w["name"] == MyFirstWorkflow5.name
+        )
+        self.assertIsNone(workflow["pk"])
+        self.assertEqual(workflow["state"], "init")
+        self.assertFalse(
+            PieuvreProcess.objects.filter(workflow_name=MyFirstWorkflow5.name).exists()
+        )
+        # Other workflows are still persisted when read
+        self.assertTrue(
+            PieuvreProcess.objects.filter(workflow_name=MyFirstWorkflow1.name).exists()
+        )
+
+    def test_lazy_process_is_persisted_when_workflow_advances(self):
+        process = MyProcess.objects.create()
+        r = self.client.post(
+            reverse("myprocess-advance-workflow", args=[process.pk]),
+            data={"workflow_name": MyFirstWorkflow5.name},
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["state"], "submitted")
+
+        pieuvre_process = PieuvreProcess.objects.get(
+            workflow_name=MyFirstWorkflow5.name
+        )
+        self.assertEqual(r.json()["pk"], str(pieuvre_process.pk))
+        self.assertEqual(pieuvre_process.state, "submitted")
+        # The manual task was created on the persisted process
+        self.assertEqual(pieuvre_process.tasks.get().task, "submitted")
+
+    def test_concurrently_persisted_process_is_not_overwritten(self):
+        process = MyProcess.objects.create()
+        wf = MyFirstWorkflow5(process)
+        # Another writer persists and advances the process in the meantime
+        other = MyFirstWorkflow5(process)
+        other.advance_workflow()
+
+        with self.assertRaises(StaleProcess):
+            wf.run_transition("initialize")
+        self.assertEqual(wf.model.pk, other.model.pk)
+        self.assertEqual(PieuvreProcess.objects.get(pk=wf.model.pk).state, "submitted")
+
+        # Advancing starts again from the persisted state
+        wf = MyFirstWorkflow5(process)
+        wf.model = PieuvreProcess(
+            content_type_id=other.model.content_type_id,
+            object_id=process.pk,
+            workflow_name=MyFirstWorkflow5.name,
+            state="init",
+        )
+        wf.advance_workflow()
+        self.assertEqual(wf.model.pk, other.model.pk)
+        self.assertEqual(wf.state, "submitted")
+        self.assertEqual(PieuvreTask.objects.filter(process=wf.model).count(), 1)
+
+    def test_advance_workflow_requires_a_workflow(self):
+        process = MyProcess.objects.create()
+        r = self.client.post(
+            reverse("myprocess-advance-workflow", args=[process.pk]),
+            data={"workflow_name": "DoesNotExist"},
+        )
+        self.assertEqual(r.status_code, 400)
+
+        r = self.client.post(
+            reverse("myprocess-advance-workflow", args=[process.pk]), data={}
+        )
+        self.assertEqual(r.status_code, 400)
+
+
+class BulkStartTest(PieuvreTestCase):
+    def test_bulk_start_advances_workflows_and_creates_tasks(self):
+        user = UserFactory()
+        processes = [MyProcess.objects.create() for i in range(10)]
+        # An already started workflow is left untouched
+        MyFirstWorkflow1(processes[0], initial_state="done")
+
+        started = MyFirstWorkflow1.bulk_start(MyProcess.objects.all(), batch_size=4)
+        self.assertEqual(len(started), 9)
+        self.assertEqual(
+            PieuvreProcess.objects.filter(
+                workflow_name=MyFirstWorkflow1.name, state="submitted"
+            ).count(),
+            9,
+        )
+        self.assertEqual(
+            PieuvreProcess.objects.get(
+                workflow_name=MyFirstWorkflow1.name, object_id=processes[0].pk
+            ).state,
+            "done",
+        )
+
+        # The manual transition created a task on every started workflow
+        tasks = PieuvreTask.objects.filter(process__in=started)
+        self.assertEqual(tasks.count(), 9)
+        for task in tasks:
+            self.assertEqual(task.task, "submitted")
+            self.assertEqual(task.name, "Submitted State")
+            self.assertEqual(list(task.users.all()), [user])
+            self.assertEqual(
+                list(task.assignees.values_list("principal_type", "principal_id")),
+                [(TASK_PRINCIPAL_TYPES.USER, user.pk)],
+            )
+
+        # Tasks can be completed as usual
+        task = tasks.first()
+        task.complete("finish")
+        task.process.refresh_from_db()
+        self.assertEqual(task.process.state, "done")
+
+    def test_bulk_start_without_advancing(self):
+        processes = [MyProcess.objects.create() for i in range(3)]
+        started = MyFirstWorkflow4.bulk_start(processes, advance=False)
+        self.assertEqual(len(started), 3)
+        self.assertTrue(all(p.state == "init" for p in started))
+        self.assertFalse(PieuvreTask.objects.exists())
+        # Starting again is a no-op
+        self.assertEqual(MyFirstWorkflow4.bulk_start(processes), [])
+
+    def test_bulk_advance_rejects_concurrently_modified_processes(self):
+        targets = [MyProcess.objects.create() for i in range(3)]
+        processes = MyFirstWorkflow4.bulk_start(targets, advance=False)
+        # Another writer advances one of the processes in the meantime
+        PieuvreProcess.objects.filter(pk=processes[0].pk).update(
+            state="submitted", revision=F("revision") + 1
+        )
+
+        with self.assertRaises(StaleProcess):
+            MyFirstWorkflow4._bulk_advance(processes)
+        self.assertEqual(
+            sorted(PieuvreProcess.objects.values_list("state", flat=True)),
+            ["init", "init", "submitted"],
+        )
+        self.assertFalse(PieuvreTask.objects.exists())
+
+
+class TransitionIndexTest(PieuvreTestCase):
+    def test_transitions_are_indexed(self):
+        index = MyFirstWorkflow4.get_transition_index()
+        self.assertEqual(
+            [t["name"] for t in index.for_source("submitted")],
+            ["accept", "reject", "withdraw"],
+        )
+        self.assertEqual(index.for_source("accepted"), ())
+        self.assertEqual(index.get("submit")["destination"], "submitted")
+        self.assertIsNone(index.get("does_not_exist"))
+
+        # The index is read-only
+        with self.assertRaises(TypeError):
+            index.by_name["does_not_exist"] = {}
+
+    def test_workflow_lookups_use_the_index(self):
+        wf = MyFirstWorkflow4(MyProcess.objects.create(), initial_state="submitted")
+        self.assertEqual(
+            wf.get_available_transitions(),
+            list(MyFirstWorkflow4.get_transition_index().for_source("submitted")),
+        )
+        self.assertEqual(wf.get_available_transitions("edited")[0]["name"], "submit")
+        self.assertTrue(wf.is_transition("withdraw"))
+        self.assertFalse(wf.is_transition("does_not_exist"))
+        self.assertEqual(wf._get_next_transition()["name"], "accept")
+
+
+class WorkflowGraphTest(PieuvreTestCase):
+    def test_automatic_paths_are_precomputed(self):
+        graph = MyFirstWorkflow5.get_workflow_graph()
+        self.assertEqual(
+            [t["name"] for t in graph.get_automatic_path("init")],
+            ["initialize", "submit"],
+        )
+        self.assertEqual(graph.get_automatic_path("submitted"), ())
+        self.assertEqual(graph.unreachable_states, ("withdrawn",))
+
+    def test_advance_workflow_follows_the_automatic_path(self):
+        wf = MyFirstWorkflow4(MyProcess.objects.create(), initial_state="init")
+        with mock.patch.object(
+            MyFirstWorkflow4,
+            "_get_next_transition",
+            wraps=wf._get_next_transition,
+        ) as next_transition:
+            wf.advance_workflow()
+        self.assertEqual(wf.state, "edited")
+        # Only the manual transition was looked for
+        self.assertEqual(next_transition.call_count, 1)
+
+    @staticmethod
+    def _get_check_errors(workflow_class):
+        return [e for e in check_workflow_graphs() if e.obj is workflow_class]
+
+    def test_demo_workflows_pass_the_checks(self):
+        # Workflows defined by the tests are registered on the demo app too
+        errors = check_workflow_graphs([apps.get_app_config("demo")])
+        self.assertEqual(
+            [e for e in errors if e.obj.__module__ == MyFirstWorkflow1.__module__], []
+        )
+
+    def test_automatic_cycle_is_reported(self):
+        class CyclicWorkflow(Workflow):
+            persist = True
+            states = ["a", "b", "c"]
+            transitions = [
+                {"name": "go", "source": "a", "destination": "b"},
+                {"name": "back", "source": "b", "destination": "a"},
+                {"name": "leave", "source": "c", "destination": "a"},
+            ]
+
+        errors = self._get_check_errors(CyclicWorkflow)
+        self.assertEqual([e.id for e in errors], ["djpieuvre.E001"])
+        self.assertIn("automatic transitions cycle: a -> b -> a", errors[0].msg)
+
+        # Advancing fails as it would without the analysis
+        self.assertEqual(
+            CyclicWorkflow.get_workflow_graph().get_automatic_path("c"), ()
+        )
+        wf = CyclicWorkflow(MyProcess.objects.create(), initial_state="c")
+        with self.assertRaises(CircularWorkflowError):
+            wf.advance_workflow()
+
+    def test_ambiguous_automatic_transitions_are_reported(self):
+        class AmbiguousWorkflow(Workflow):
+            persist = True
+            states = ["a", "b", "c", "d"]
+            transitions = [
+                {"name": "finish", "source": "a", "destination": "b", "manual": True},
+                {"name": "to_c", "source": "b", "destination": "c"},
+                {"name": "to_d", "source": "b", "destination": "d"},
+            ]
+
+        errors = self._get_check_errors(AmbiguousWorkflow)
+        self.assertEqual([e.id for e in errors], ["djpieuvre.E001"])
+        self.assertIn(
+            "ambiguous automatic transitions from state b: to_c, to_d", errors[0].msg
+        )
+
+        # Completing the task reaches the ambiguous state: the API rejects it
+        AmbiguousWorkflow(MyProcess.objects.create()).advance_workflow()
+        task = PieuvreTask.objects.get()
+        self.client.force_authenticate(user=UserFactory())
+        response = self.client.post(
+            reverse("pieuvretask-complete", kwargs={"pk": task.pk}),
+            data={"transition": "finish"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.CREATED)
+
+    def test_automatic_path_stops_when_the_process_does_not_follow_it(self):
+        wf = MyFirstWorkflow5(MyProcess.objects.create(), initial_state="init")
+        with mock.patch.object(
+            MyFirstWorkflow5,
+            "get_available_transitions",
+            lambda self, state=None, return_all=True: [],
+        ):
+            wf._run_automatic_path()
+        self.assertEqual(wf.state, "init")
+
+    def test_conditional_transitions_are_not_analyzed(self):
+        class ConditionalWorkflow(Workflow):
+            states = ["a", "b", "c"]
+            transitions = [
+                {"name": "to_b", "source": "a", "destination": "b"},
+                {"name": "to_c", "source": "a", "destination": "c"},
+                {"name": "back", "source": "b", "destination": "a"},
+            ]
+
+            def check_to_b(self):
+                return False
+
+        graph = ConditionalWorkflow.get_workflow_graph()
+        self.assertEqual(graph.get_automatic_path("a"), ())
+        self.assertEqual([t["name"] for t in graph.get_automatic_path("b")], ["back"])
+
+
+class IdentityMapTest(PieuvreTestCase):
+    def test_workflows_are_built_once_per_scope(self):
+        process = MyProcess.objects.create()
+        with workflow_scope():
+            workflows = process.workflow_instances
+            # Processes are not fetched again
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    [id(w) for w in process.workflow_instances],
+                    [id(w) for w in workflows],
+                )
+
+            # The workflow is shared with its process
+            workflow = next(w for w in workflows if w.name == MyFirstWorkflow1.name)
+            pieuvre_process = PieuvreProcess.objects.get(pk=workflow.model.pk)
+            self.assertIs(pieuvre_process.workflow, workflow)
+            self.assertIs(workflow.model, pieuvre_process)
+
+        # Outside of a scope, workflows are built again
+        self.assertIsNot(MyFirstWorkflow1.get_instance(process), workflow)
+
+    def test_task_completion_shares_the_workflow(self):
+        process = MyProcess.objects.create()
+        MyFirstWorkflow1(process, initial_state="submitted").advance_workflow()
+        task = PieuvreTask.objects.get()
+        with workflow_scope():
+            workflow = MyFirstWorkflow1.get_instance(process)
+            task.complete("finish")
+            # The workflow of the scope was advanced
+            self.assertEqual(workflow.state, "done")
+            self.assertEqual(task.process.state, "done")
+
+
+class HasPermBackend:
+    """
+    Authentication backend granting a permission without listing it in `get_all_permissions`.
+    """
+
+    def authenticate(self, request, **credentials):
+        return None
+
+    def has_perm(self, user_obj, perm, obj=None):
+        return perm == "demo.access_my_first_workflow2_write"
+
+
+class AuthorizationSnapshotTest(PieuvreTestCase):
+    def test_authorizations_are_computed_once_per_scope(self):
+        user = UserFactory()
+        user.groups.add(GroupFactory(name="Completers"))
+        user.user_permissions.add(
+            Permission.objects.get(codename="access_my_first_workflow2_read")
+        )
+        processes = [MyProcess.objects.create() for i in range(5)]
+        workflows = [
+            workflow_class(process, initial_state=initial_state)
+            for process in processes
+            for workflow_class, initial_state in (
+                (MyFirstWorkflow2, "in_progress"),
+                (MyFirstWorkflow3, "progressing"),
+            )
+        ]
+        user = User.objects.get(pk=user.pk)
+
+        with workflow_scope():
+            snapshot = get_authorization_snapshot(user)
+            self.assertEqual(snapshot.group_ids, {user.groups.get().pk})
+            self.assertIn("demo.access_my_first_workflow2_read", snapshot.permissions)
+            workflows[-1].get_authorized_transitions(user=user)
+
+            with self.assertNumQueries(0):
+                for workflow in workflows:
+                    self.assertTrue(
+                        workflow.is_allowed(user, perm=WORKFLOW_PERM_SUFFIX_READ)
+                    )
+                    self.assertEqual(
+                        workflow.is_allowed(user),
+                        workflow.name != MyFirstWorkflow2.name,
+                    )
+                    if workflow.name == MyFirstWorkflow3.name:
+                        self.assertEqual(
+                            workflow.get_authorized_transitions(user=user)[0]["name"],
+                            "complete",
+                        )
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            "django.contrib.auth.backends.ModelBackend",
+            "demo.tests.HasPermBackend",
+        ]
+    )
+    def test_permissions_not_listed_by_backends_are_checked(self):
+        user = UserFactory()
+        workflow = MyFirstWorkflow2(MyProcess.objects.create())
+
+        with workflow_scope():
+            snapshot = get_authorization_snapshot(user)
+            self.assertTrue(workflow.is_allowed(user))
+            self.assertNotIn(
+                "demo.access_my_first_workflow2_write", snapshot.permissions
+            )
+            self.assertFalse(workflow.is_allowed(user, perm=WORKFLOW_PERM_SUFFIX_READ))
+
+    def test_permission_codenames_are_precomputed(self):
+        self.assertEqual(
+            MyFirstWorkflow2.get_permission_codename(WORKFLOW_PERM_SUFFIX_READ),
+            "access_my_first_workflow2_read",
+        )
+        self.assertEqual(
+            MyFirstWorkflow2.get_permission_codename("delete"),
+            "access_my_first_workflow2_delete",
+        )
+
+
+class IdHooksTest(PieuvreTestCase):
+    def test_id_hooks_return_primary_keys(self):
+        group = GroupFactory(name="Researcher Team")
+        wf = MyFirstWorkflow4(MyProcess.objects.create(), initial_state="edited")
+        self.assertEqual(
+            set(wf.groups_who_can_submit(tuple({"name": "submit"}.items()))),
+            {group.pk},
+        )
+
+    def test_tasks_are_assigned_and_authorized_with_ids(self):
+        group = GroupFactory(name="Researcher Team")
+        user = UserFactory()
+        user.groups.add(group)
+        wf = MyFirstWorkflow4(MyProcess.objects.create(), initial_state="init")
+        wf.advance_workflow()
+
+        task = PieuvreTask.objects.get()
+        self.assertEqual(list(task.groups.all()), [group])
+        self.assertEqual(
+            set(task.assignees.values_list("principal_type", "principal_id")),
+            {(TASK_PRINCIPAL_TYPES.GROUP, group.pk)},
+        )
+        self.assertEqual(
+            [t["name"] for t in wf.get_authorized_transitions(user=user)], ["submit"]
+        )
+        self.assertEqual(wf.get_authorized_transitions(user=UserFactory()), [])
+
+
+@override_settings(DJPIEUVRE={"TASK_REPR_SNAPSHOT": True})
+class ReprSnapshotTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=UserFactory())
+        self.process = MyProcess.objects.create(my_property="first")
+        MyFirstWorkflow1(self.process, initial_state="submitted").advance_workflow()
+
+    def test_task_list_does_not_load_targets(self):
+        self.assertEqual(PieuvreTask.objects.get().repr_snapshot, "first")
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse("pieuvretask-list"))
+        self.assertEqual(r.json()[0]["instance_repr"], "first")
+        target_table = MyProcess._meta.db_table
+        self.assertFalse(any(target_table in q["sql"] for q in ctx.captured_queries))
+
+    def test_refresh_repr_snapshot(self):
+        self.process.my_property = "second"
+        self.process.save()
+        self.assertEqual(PieuvreTask.refresh_repr_snapshot(self.process), 1)
+        self.assertEqual(PieuvreTask.objects.get().repr_snapshot, "second")
+
+    def test_refresh_command(self):
+        MyProcess.objects.update(my_property="third")
+        out = StringIO()
+        call_command("pieuvre_refresh_task_repr", stdout=out)
+        self.assertIn("1 tasks refreshed", out.getvalue())
+        self.assertEqual(PieuvreTask.objects.get().repr_snapshot, "third")
+
+
+class WorkflowMetadataTest(PieuvreTestCase):
+    def test_metadata_is_computed_at_registration(self):
+        metadata = get_metadata(MyFirstWorkflow1.name, 1)
+        self.assertIs(metadata, MyFirstWorkflow1.get_metadata())
+        self.assertEqual(metadata.fancy_name, "My first workflow")
+        self.assertEqual(metadata.states["submitted"], "Submitted State")
+        self.assertEqual(
+            [t["name"] for t in metadata.transitions], ["submit", "finish", "report"]
+        )
+        self.assertEqual(
+            MyFirstWorkflow2.get_metadata().get_states(),
+            ["init", "in_progress", "completed"],
+        )
+        # The latest version is returned by default
+        self.assertIs(get_metadata(MyFirstWorkflow1.name), metadata)
+
+        # Metadata is read-only
+        with self.assertRaises(TypeError):
+            metadata.states["submitted"] = "Other"
+
+    def test_unknown_workflow(self):
+        self.assertIsNone(get_workflow("DoesNotExist", 1))
+        with self.assertRaises(WorkflowDoesNotExist):
+            get_metadata("DoesNotExist")
+        with self.assertRaises(WorkflowDoesNotExist):
+            get_metadata(MyFirstWorkflow1.name, 2)
+
+
+class AsyncHookWorkflow(Workflow):
+    persist = True
+    states = ["todo", "done"]
+    transitions = [
+        {"name": "finish", "source": "todo", "destination": "done", "manual": True}
+    ]
+
+    @on_task_assign_user("finish")
+    async def users_who_can_finish(self, transition):
+        return User.objects.filter(username="finisher")
+
+
+class AsyncWorkflowTest(PieuvreTestCase):
+    async def test_workflow_instances(self):
+        process = await MyProcess.objects.acreate()
+        with workflow_scope():
+            workflows = await process.aworkflow_instances()
+            self.assertEqual(
+                [w.name for w in workflows], [w.name for w in process.workflows]
+            )
+            # Workflows are shared with the rest of the scope
+            self.assertIs((await process.aworkflow_instances())[0], workflows[0])
+
+        workflow = next(w for w in workflows if w.name == MyFirstWorkflow1.name)
+        pieuvre_process = await PieuvreProcess.objects.aget(pk=workflow.model.pk)
+        workflow = await pieuvre_process.aget_workflow()
+        self.assertEqual(workflow.name, MyFirstWorkflow1.name)
+        self.assertEqual(workflow.process_target, process)
+
+    async def test_advance_workflow_and_complete(self):
+        user = await User.objects.acreate(username="user")
+        process = await MyProcess.objects.acreate()
+        workflow = await MyFirstWorkflow1.aget_instance(process)
+        await workflow.aadvance_workflow()
+
+        self.assertEqual(workflow.state, "submitted")
+        task = await PieuvreTask.objects.aget()
+        self.assertEqual(task.task, "submitted")
+        self.assertEqual(
+            [
+                a
+                async for a in task.assignees.values_list(
+                    "principal_type", "principal_id"
+                )
+            ],
+            [(TASK_PRINCIPAL_TYPES.USER, user.pk)],
+        )
+
+        task = await PieuvreTask.objects.aget()
+        await task.acomplete("finish")
+        await task.asave()
+        process = await PieuvreProcess.objects.aget(pk=workflow.model.pk)
+        self.assertEqual(process.state, "done")
+        self.assertEqual(process.revision, workflow.model.revision + 2)
+        self.assertEqual(
+            {t async for t in PieuvreTask.objects.values_list("task", "state")},
+            {("submitted", TASK_STATES.DONE), ("done", TASK_STATES.CREATED)},
+        )
+
+    async def test_transition_hooks_can_query_the_database(self):
+        seen = []
+
+        def on_enter_submitted(workflow, transition):
+            seen.append(PieuvreProcess.objects.get(pk=workflow.model.pk).state)
+
+        with mock.patch.object(
+            MyFirstWorkflow1, "on_enter_submitted", on_enter_submitted, create=True
+        ):
+            workflow = await MyFirstWorkflow1.aget_instance(
+                await MyProcess.objects.acreate()
+            )
+            await workflow.aadvance_workflow()
+
+        # Automatic transitions run in a single transaction and the process is saved at the end
+        self.assertEqual(seen, ["created"])
+        self.assertEqual(workflow.state, "submitted")
+
+    async def test_lazy_process_is_persisted_when_the_workflow_advances(self):
+        process = await MyProcess.objects.acreate()
+        workflow = await MyFirstWorkflow5.aget_instance(process, initial_state="init")
+        self.assertFalse(workflow.is_persisted)
+
+        await workflow.aadvance_workflow()
+        self.assertTrue(workflow.is_persisted)
+        self.assertEqual(
+            (await PieuvreProcess.objects.aget(pk=workflow.model.pk)).state,
+            workflow.state,
+        )
+
+    async def test_authorized_transitions(self):
+        group = await Group.objects.acreate(name="Completers")
+        user = await User.objects.acreate(username="user")
+        await user.groups.aadd(group)
+        process = await MyProcess.objects.acreate()
+        workflow = await MyFirstWorkflow3.aget_instance(
+            process, initial_state="progressing"
+        )
+
+        transitions = await workflow.aget_authorized_transitions(user=user)
+        self.assertEqual([t["name"] for t in transitions], ["complete"])
+        self.assertEqual(
+            await workflow.aget_authorized_transitions(
+                user=await User.objects.acreate(username="other")
+            ),
+            [],
+        )
+
+    async def test_async_hooks(self):
+        user = await User.objects.acreate(username="finisher")
+        process = await MyProcess.objects.acreate()
+        workflow = await AsyncHookWorkflow.aget_instance(process)
+        await workflow.aadvance_workflow()
+
+        task = await PieuvreTask.objects.aget()
+        self.assertEqual([u async for u in task.users.all()], [user])
+        self.assertEqual(
+            [t["name"] for t in await workflow.aget_authorized_transitions(user=user)],
+            ["finish"],
+        )
+
+    def test_async_hooks_in_sync_apis(self):
+        user = UserFactory(username="finisher")
+        workflow = AsyncHookWorkflow(MyProcess.objects.create())
+        workflow.advance_workflow()
+
+        self.assertEqual(list(PieuvreTask.objects.get().users.all()), [user])
+        self.assertEqual(
+            [t["name"] for t in workflow.get_authorized_transitions(user=user)],
+            ["finish"],
+        )
+
+
+class ConcurrentHooksWorkflow(Workflow):
+    persist = True
+    states = ["todo", "done"]
+    transitions = [
+        {"name": "finish", "source": "todo", "destination": "done", "manual": True}
+    ]
+    delay = 0.2
+    user_ids = ()
+    group_ids = ()
+
+    @on_task_assign_user("finish", cache=False, ids=True)
+    def users_from_directory(self, transition):
+        time.sleep(self.delay)
+        return self.user_ids
+
+    @on_task_assign_user("finish", cache=False, ids=True)
+    def users_from_reports(self, transition):
+        time.sleep(self.delay)
+        return ()
+
+    @on_task_assign_group("finish", cache=False, ids=True)
+    def groups_from_directory(self, transition):
+        time.sleep(self.delay)
+        return self.group_ids
+
+
+class AsyncConcurrentHooksWorkflow(ConcurrentHooksWorkflow):
+    @on_task_assign_user("finish", cache=False, ids=True)
+    async def users_from_directory(self, transition):
+        await asyncio.sleep(self.delay)
+        return self.user_ids
+
+    @on_task_assign_user("finish", cache=False, ids=True)
+    async def users_from_reports(self, transition):
+        await asyncio.sleep(self.delay)
+        return ()
+
+    @on_task_assign_group("finish", cache=False, ids=True)
+    async def groups_from_directory(self, transition):
+        await asyncio.sleep(self.delay)
+        return self.group_ids
+
+
+@override_settings(DJPIEUVRE={"HOOK_EXECUTOR": {"MAX_WORKERS": 4, "TIMEOUT": 5}})
+class HookExecutorTest(PieuvreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.group = GroupFactory()
+        self.user.groups.add(self.group)
+
+    def test_hooks_are_evaluated_concurrently(self):
+        workflow = ConcurrentHooksWorkflow(MyProcess.objects.create())
+        with mock.patch.object(
+            ConcurrentHooksWorkflow, "user_ids", [self.user.pk]
+        ), mock.patch.object(ConcurrentHooksWorkflow, "group_ids", [self.group.pk]):
+            start = time.monotonic()
+            workflow.advance_workflow()
+            # Bounded by the slowest hook rather than the sum of the three hooks
+            self.assertLess(time.monotonic() - start, 2 * workflow.delay)
+
+            task = PieuvreTask.objects.get()
+            self.assertEqual(list(task.users.all()), [self.user])
+            self.assertEqual(list(task.groups.all()), [self.group])
+
+            start = time.monotonic()
+            self.assertEqual(
+                [
+                    t["name"]
+                    for t in workflow.get_authorized_transitions(user=self.user)
+                ],
+                ["finish"],
+            )
+            self.assertLess(time.monotonic() - start, 2 * workflow.delay)
+
+    @override_settings(DJPIEUVRE={"HOOK_EXECUTOR": {"TIMEOUT": 0.05}})
+    def test_hooks_timeout(self):
+        workflow = ConcurrentHooksWorkflow(MyProcess.objects.create())
+        with self.assertRaises(HookTimeout):
+            workflow.advance_workflow()
+        self.assertFalse(PieuvreTask.objects.exists())
+
+    async def test_async_hooks_are_gathered(self):
+        process = await MyProcess.objects.acreate()
+        workflow = await AsyncConcurrentHooksWorkflow.aget_instance(process)
+        with mock.patch.object(
+            AsyncConcurrentHooksWorkflow, "user_ids", [self.user.pk]
+        ), mock.patch.object(
+            AsyncConcurrentHooksWorkflow, "group_ids", [self.group.pk]
+        ):
+            start = time.monotonic()
+            await workflow.aadvance_workflow()
+            self.assertLess(time.monotonic() - start, 2 * workflow.delay)
+
+            task = await PieuvreTask.objects.aget()
+            self.assertEqual([u async for u in task.users.all()], [self.user])
+            self.assertEqual([g async for g in task.groups.all()], [self.group])
+
+
+class InstanceHookWorkflow(Workflow):
+    persist = True
+    states = ["todo", "done"]
+    transitions = [
+        {"name": "finish", "source": "todo", "destination": "done", "manual": True}
+    ]
+
+    @on_task_assign_user("finish")
+    def owners(self, transition):
+        return User.objects.filter(username=self.process_target.my_property)
+
+
+@override_settings(DJPIEUVRE=LOCAL_HOOK_CACHE)
+class HookCacheTest(PieuvreTestCase):
+    def test_hooks_are_not_cached_by_default(self):
+        users = [UserFactory(username=name) for name in ("alice", "bob")]
+        for user in users:
+            InstanceHookWorkflow(
+                MyProcess.objects.create(my_property=user.username)
+            ).advance_workflow()
+
+        for user in users:
+            task = PieuvreTask.objects.get(
+                process__object_id__in=MyProcess.objects.filter(
+                    my_property=user.username
+                ).values("pk")
+            )
+            self.assertEqual(list(task.users.all()), [user])
+        self.assertFalse(InstanceHookWorkflow.owners.shared)
+
+    def test_uncached_hooks_keep_the_lru_cache_interface(self):
+        InstanceHookWorkflow.owners.cache_clear()
+        self.assertEqual(
+            InstanceHookWorkflow.owners.cache_info(), CacheInfo(0, 0, 0, 0)
+        )
+
+    def test_cache_is_invalidated_when_users_change(self):
+        user = UserFactory(username="alice")
+        wf = MyFirstWorkflow3(MyProcess.objects.create())
+        transition = tuple(wf.transitions[1].items())
+        hook_cache = get_hook_cache()
+
+        wf.users_who_can_complete(transition)
+        user.save(update_fields=["last_login"])
+        self.assertEqual(hook_cache.cache_info().currsize, 1)
+
+        user.is_active = False
+        user.save()
+        self.assertEqual(hook_cache.cache_info().currsize, 0)
+
+        group = GroupFactory(name="Completers Team")
+        wf.users_who_can_complete(transition)
+        user.groups.add(group)
+        self.assertEqual(hook_cache.cache_info().currsize, 0)
+
+
+@override_settings(
+    DJPIEUVRE={"HOOK_CACHE": {"BACKEND": "djpieuvre.cache.DjangoHookCache"}}
+)
+class DjangoHookCacheTest(PieuvreTestCase):
+    def test_clearing_the_cache_changes_the_keys(self):
+        hook_cache = get_hook_cache()
+        key = hook_cache.make_key(("workflow", 1, "hook", "transition"))
+        hook_cache.set(key, [1])
+        self.assertEqual(hook_cache.get(key), [1])
+
+        hook_cache.clear()
+        new_key = hook_cache.make_key(("workflow", 1, "hook", "transition"))
+        self.assertNotEqual(new_key, key)
+        self.assertIs(hook_cache.get(new_key), _MISSING)
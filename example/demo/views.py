@@ -7,4 +7,4 @@ from .serializers import MyProcessSerializer
 
 class MyProcessViewSet(WorkflowModelMixin, AdvanceWorkflowMixin, viewsets.ModelViewSet):
     serializer_class = MyProcessSerializer
-    queryset = MyProcess.objects.all()
+    queryset = MyProcess.objects.with_workflow_processes()
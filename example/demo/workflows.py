@@ -65,11 +65,11 @@ class MyFirstWorkflow2(Workflow):
         },
     ]
 
-    @on_task_assign_group("complete")
+    @on_task_assign_group("complete", cache=True)
     def groups_who_can_complete(self, transition):
         return Group.objects.filter(name__startswith="Completers")
 
-    @on_task_assign_user("complete")
+    @on_task_assign_user("complete", cache=True)
     def users_who_can_complete(self, transition):
         return User.objects.filter(groups__name__startswith="Completers")
 
@@ -101,11 +101,11 @@ class MyFirstWorkflow3(Workflow):
         },
     ]
 
-    @on_task_assign_group("complete")
+    @on_task_assign_group("complete", cache=True)
     def groups_who_can_complete(self, transition):
         return Group.objects.filter(name__startswith="Completers")
 
-    @on_task_assign_user("complete")
+    @on_task_assign_user("complete", cache=True)
     def users_who_can_complete(self, transition):
         return User.objects.filter(groups__name__startswith="Completers")
 
@@ -158,25 +158,29 @@ class MyFirstWorkflow4(Workflow):
         },
     ]
 
-    @on_task_assign_group("submit")
+    @on_task_assign_group("submit", cache=True, ids=True)
     def groups_who_can_submit(self, transition):
         return Group.objects.filter(name__startswith="Researcher")
 
-    @on_task_assign_group("accept")
+    @on_task_assign_group("accept", cache=True, ids=True)
     def groups_who_can_accept(self, transition):
         return Group.objects.filter(name__startswith="Evaluator")
 
-    @on_task_assign_group("reject")
+    @on_task_assign_group("reject", cache=True, ids=True)
     def groups_who_can_reject(self, transition):
         return Group.objects.filter(name__startswith="Evaluator")
 
-    @on_task_assign_group("withdraw")
+    @on_task_assign_group("withdraw", cache=True, ids=True)
     def groups_who_can_withdraw(self, transition):
         return Group.objects.filter(name__startswith="Withdraw")
 
 
 class MyFirstWorkflow5(Workflow):
     persist = True
+    # The process is only saved once the workflow advances
+    lazy_persist = True
+    # Automatic transitions are saved at once
+    deferred_save = True
     states = [
         "init",
         "edited",
@@ -38,16 +38,15 @@ setup(
         "Operating System :: OS Independent",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
     ],
     packages=find_packages(exclude=("tests", "docs")),
-    install_requires=["drf-spectacular", "django-filter", "Django>3.1"],
+    install_requires=["drf-spectacular", "django-filter", "Django>=4.2"],
     setup_requires=["wheel"],
     test_suite="tests",
     tests_require=extras_require["test"],
     extras_require=extras_require,
-    python_requires=">=3.5",
+    python_requires=">=3.9",
 )